@@ -2,23 +2,23 @@ import asyncio
 from config.logger import setup_logging
 from config.settings import load_config
 from core.websocket_server import WebSocketServer
+from core.supervisor import Supervisor
 from manager.http_server import WebUI
 from aiohttp import web
 from core.utils.util import get_local_ip
 
 TAG = __name__
 
-async def main():
+async def main(config, instances=None, reuse_port=False, webui_enabled=True, worker=None):
     logger = setup_logging()
-    config = load_config()
-    
+
     # 启动 WebSocket 服务器
-    ws_server = WebSocketServer(config)
-    ws_task = asyncio.create_task(ws_server.start())
+    ws_server = WebSocketServer(config, instances, worker)
+    ws_task = asyncio.create_task(ws_server.start(reuse_port))
 
     # 启动 WebUI 服务器
     webui_runner = None
-    if config['manager'].get('enabled', False):
+    if webui_enabled and config['manager'].get('enabled', False):
         server_config = config["manager"]
         host = server_config["ip"]
         port = server_config["port"]
@@ -42,5 +42,14 @@ async def main():
         if webui_runner:
             await webui_runner.cleanup()
 
+def run_worker(config, index, instances):
+    """多进程模式的工作进程，WebUI 只在第一个工作进程中启动"""
+    asyncio.run(main(config, instances, reuse_port=True, webui_enabled=index == 0, worker=index))
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    config = load_config()
+    if config["server"].get("workers", 1) in (1, None):
+        asyncio.run(main(config))
+    else:
+        Supervisor(config).run(lambda index, instances: run_worker(config, index, instances))
@@ -2,27 +2,37 @@ import os
 import json
 import uuid
 import time
-import queue
 import asyncio
+import contextvars
 from config.logger import setup_logging
 import threading
 import websockets
 from typing import Dict, Any
 from collections import deque
-from core.utils.util import is_segment
 from core.utils.dialogue import Message, Dialogue
 from core.handle.textHandle import handleTextMessage
-from core.utils.util import get_string_no_punctuation_or_emoji
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
-from core.handle.audioHandle import handleAudioMessage, sendAudioMessage
+from core.utils.segmenter import SentenceSegmenter
+from core.utils.runtime import Runtime
+from core.handle.audioHandle import (
+    handleAudioMessage, sendAudioMessage, sendAudioPackets, sendSentenceStart, sendSentenceEnd
+)
 from config.private_config import PrivateConfig
 from core.auth import AuthMiddleware, AuthenticationError
 from core.utils.auth_code_gen import AuthCodeGenerator  # 添加导入
+from core.utils.vad import VADSessionPoolExhausted
+from core.utils.audio_buffer import PCMRingBuffer, PCMSegmentBuffer
+from core.utils.audio import OpusPacketStream
+from core.utils.tts_cache import TTSAudio
+from core.utils.phrase_bank import AUTH_CODE_PROMPT
+from core.utils.turn import TurnScope
+from core.utils.tts_pipeline import TTSPipeline
+from core.utils.playout import AudioPlayout
+from core.utils.send_queue import SendQueue
 
 TAG = __name__
 
 class ConnectionHandler:
-    def __init__(self, config: Dict[str, Any], _vad, _asr, _llm, _tts):
+    def __init__(self, config: Dict[str, Any], _vad, _asr, _llm, _tts, _tts_cache=None, _phrase_bank=None):
         self.config = config
         self.logger = setup_logging()
         self.auth = AuthMiddleware(config)
@@ -40,8 +50,16 @@ class ConnectionHandler:
         # 线程任务相关
         self.loop = asyncio.get_event_loop()
         self.stop_event = threading.Event()
-        self.tts_queue = queue.Queue()
-        self.executor = ThreadPoolExecutor(max_workers=10)
+        # CPU任务（Opus编码、片段拼接）提交到进程共享的运行时，按连接轮流执行，认证通过后创建
+        self.executor = None
+        # 按顺序播放、有限预取的TTS流水线，确定TTS实例后创建
+        self.tts_pipeline = None
+        # 按实时速度发送音频的调度器和发送任务
+        self.playout = None
+        self.playout_task = None
+        # 下发消息的发送队列和发送任务，stop 等打断类消息优先于音频
+        self.send_queue = None
+        self.send_task = None
         self.scheduled_tasks = deque()
 
         # 依赖的组件
@@ -49,22 +67,32 @@ class ConnectionHandler:
         self.asr = _asr
         self.llm = _llm
         self.tts = _tts
+        self.tts_cache = _tts_cache
+        self.phrase_bank = _phrase_bank
         self.dialogue = None
 
         # vad相关变量
-        self.client_audio_buffer = bytes()
+        self.client_audio_buffer = PCMRingBuffer()
+        self.vad_session = None
         self.client_have_voice = False
         self.client_have_voice_last_time = 0.0
         self.client_no_voice_last_time = 0.0
         self.client_voice_stop = False
 
         # asr相关变量
-        self.asr_audio = []
+        self.asr_audio = PCMSegmentBuffer()
+        # 流式识别的连接状态，ASR不支持流式识别时为 None
+        self.asr_stream = None
         self.asr_server_receive = True
 
         # llm相关变量
         self.llm_finish_task = False
-        self.dialogue = Dialogue()
+        self.llm_task = None
+        # 当前这一轮对话的取消范围，打断时取消其中的LLM和TTS任务
+        self.turn = None
+        self.dialogue = Dialogue.from_config(self.config.get("dialogue", {}))
+        # 后台生成对话摘要的任务
+        self.summary_task = None
 
         # tts相关变量
         self.tts_first_text = None
@@ -122,31 +150,44 @@ class ConnectionHandler:
                     raise
 
             # 认证通过,继续处理
+            # 分配连接独占的VAD会话（独立的解码器和模型状态），会话用完时拒绝连接，这时还没有占用运行时
+            self.vad_session = self.vad.acquire_session()
+            self.executor = Runtime.get_instance().create_executor()
+            self.asr_stream = self.asr.create_stream()
+            self.tts_pipeline = TTSPipeline.from_config(self.executor, self.config.get("tts_pipeline", {}), self.tts)
             self.websocket = ws
+            self.send_queue = SendQueue.from_config(ws, self.config.get("send_queue", {}))
+            self.send_task = asyncio.create_task(self.send_queue.run())
+            self.playout = AudioPlayout(self.send_queue.send, self.config.get("playout", {}).get("lead_ms", 300) / 1000)
             self.session_id = str(uuid.uuid4())
 
             self.welcome_msg = self.config["xiaozhi"]
             self.welcome_msg["session_id"] = self.session_id
-            await self.websocket.send(json.dumps(self.welcome_msg))
+            await self.send_queue.send(json.dumps(self.welcome_msg))
 
             await self.loop.run_in_executor(None, self._initialize_components)
 
-            tts_priority = threading.Thread(target=self._priority_thread, daemon=True)
-            tts_priority.start()
+            self.playout_task = asyncio.create_task(self._playout_loop())
 
             try:
                 async for message in self.websocket:
                     await self._route_message(message)
             except websockets.exceptions.ConnectionClosed:
                 self.logger.bind(tag=TAG).info("客户端断开连接")
+            finally:
                 await self.close()
 
         except AuthenticationError as e:
             self.logger.bind(tag=TAG).error(f"Authentication failed: {str(e)}")
             await ws.close()
             return
+        except VADSessionPoolExhausted as e:
+            self.logger.bind(tag=TAG).error(f"Connection rejected: {str(e)}")
+            await ws.close()
+            return
         except Exception as e:
             self.logger.bind(tag=TAG).error(f"Connection error: {str(e)}")
+            await self.close()
             await ws.close()
             return
 
@@ -167,16 +208,15 @@ class ConnectionHandler:
             self.prompt = self.prompt.replace("{date_time}", date_time)
         self.dialogue.put(Message(role="system", content=self.prompt))
           
-    async def _check_and_broadcast_auth_code(self):
+    async def _check_and_broadcast_auth_code(self, turn):
         """检查设备绑定状态并广播认证码"""
         if not self.private_config.get_owner():
             auth_code = self.private_config.get_auth_code()
             if auth_code:
                 # 发送验证码语音提示
-                text = f"请在后台输入验证码：{' '.join(auth_code)}"
+                text = f"{AUTH_CODE_PROMPT}{' '.join(auth_code)}"
                 self.recode_first_last_text(text)
-                future = self.executor.submit(self.speak_and_play, text)
-                self.tts_queue.put(future)
+                self.tts_pipeline.put(turn, text, self.speak_auth_code, auth_code, text)
             return False
         return True
 
@@ -187,80 +227,73 @@ class ConnectionHandler:
             return False
         return not self.is_device_verified
     
-    def chat(self, query):
+    def start_turn(self, query):
+        """开始新一轮对话，LLM任务和之后提交的TTS任务都登记到这一轮的取消范围"""
+        self.turn = TurnScope(self.loop)
+        self.llm_task = self.turn.add_task(asyncio.create_task(self.chat(query, self.turn)))
+        return self.turn
+
+    def abort_turn(self):
+        """打断当前一轮对话：关闭LLM流，取消未开始和进行中的TTS任务，清空待播放队列"""
+        self.client_abort = True
+        if self.turn is not None:
+            self.turn.cancel(self.tts_pipeline)
+        if self.playout is not None:
+            # 正在发送的语音在一帧之内停止
+            self.playout.interrupt()
+        if self.send_queue is not None:
+            # 还没写入 websocket 的音频也不再发送
+            self.send_queue.clear_audio()
+
+    async def chat(self, query, turn):
+        """在连接的事件循环中读取LLM的流式响应，按句提交TTS任务"""
         self.logger.bind(tag=TAG).info(f"开始处理对话: {self.headers}")
         # 如果设备未验证，就发送验证码
         if self.isNeedAuth():
             self.llm_finish_task = True
-            # 创建一个新的事件循环来运行异步函数
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(self._check_and_broadcast_auth_code())
-            finally:
-                loop.close()
+            await self._check_and_broadcast_auth_code(turn)
             return True
         
         self.dialogue.put(Message(role="user", content=query))
+        self._fold_dialogue()
         response_message = []
-        start = 0
         # 提交 LLM 任务
         try:
-            start_time = time.time()  # 记录开始时间
-            llm_responses = self.llm.response(self.session_id, self.dialogue.get_llm_dialogue(), self.headers)
+            llm_responses = self.llm.response_async(self.session_id, self.dialogue.get_llm_dialogue(), self.headers)
         except Exception as e:
             self.logger.bind(tag=TAG).error(f"LLM 处理出错 {query}: {e}")
             return None
-        # 提交 TTS 任务到线程池
+        # 边接收边分句，每句提交一个 TTS 任务到线程池
+        segmenter = SentenceSegmenter.from_config(self.config.get("segmenter", {}))
         self.llm_finish_task = False
-        for content in llm_responses:
-            response_message.append(content)
-            # 如果中途被打断，就停止生成
-            if self.client_abort:
-                start = len(response_message)
-                break
-
-            end_time = time.time()  # 记录结束时间
-            if is_segment(response_message, start):
-                segment_text = "".join(response_message[start:])
-                self.logger.bind(tag=TAG).info(f"1,segment_text: {segment_text}")
-                segment_text = get_string_no_punctuation_or_emoji(segment_text)
-                if (len(segment_text) > 0 and len(segment_text) <= 25):
-                    self.recode_first_last_text(segment_text)
-                    future = self.executor.submit(self.speak_and_play, segment_text)
-                    self.tts_queue.put(future)
-                    start = len(response_message)
-                # 如果 segment_text 超过 25 个字，则拆分成多个数据包
-                while len(segment_text) > 25:
-                    part = segment_text[:25]
-                    segment_text = segment_text[25:]
-                    self.recode_first_last_text(part)
-                    self.logger.bind(tag=TAG).info(f"1,part: {part}")
-                    future = self.executor.submit(self.speak_and_play, part)
-                    self.tts_queue.put(future)
-                    start = len(response_message)
-
+        aborted = False
+        try:
+            async for content in llm_responses:
+                response_message.append(content)
+                # 如果中途被打断，就停止生成
+                if self.client_abort:
+                    aborted = True
+                    break
+                for segment_text in segmenter.feed(content):
+                    self._submit_tts(turn, segment_text)
+        except asyncio.CancelledError:
+            # 整轮被打断：LLM流随任务取消而关闭，已生成的内容仍记入对话
+            self.llm_finish_task = True
+            self.dialogue.put(Message(role="assistant", content="".join(response_message)))
+            raise
 
+        # 中途打断时关闭响应流，释放HTTP连接
+        await llm_responses.aclose()
 
         # 处理剩余的响应
-        if start < len(response_message):
-            segment_text = "".join(response_message[start:]).strip()
-            self.logger.bind(tag=TAG).info(f"2,segment_text: {segment_text}")
-            segment_text = get_string_no_punctuation_or_emoji(segment_text)
-            if (len(segment_text) > 0 and len(segment_text) <= 25):
-                self.recode_first_last_text(segment_text)
-                future = self.executor.submit(self.speak_and_play, segment_text)
-                self.tts_queue.put(future)
-                start = len(response_message)
-            # 如果 segment_text 超过 25 个字，则拆分成多个数据包
-            while len(segment_text) > 25:
-                part = segment_text[:25]
-                segment_text = segment_text[25:]
-                self.recode_first_last_text(part)
-                self.logger.bind(tag=TAG).info(f"2,part: {part}")
-                future = self.executor.submit(self.speak_and_play, part)
-                self.tts_queue.put(future)
-                start = len(response_message)
+        if not aborted:
+            for segment_text in segmenter.flush():
+                self._submit_tts(turn, segment_text)
+        first_segment_ms = segmenter.first_segment_ms
+        self.logger.bind(tag=TAG).info(
+            f"首句耗时: {'-' if first_segment_ms is None else f'{first_segment_ms:.0f}ms'}, "
+            f"TTS调用: {segmenter.segments}次, 回复字数: {sum(len(content) for content in response_message)}"
+        )
 
         self.llm_finish_task = True
         # 更新对话
@@ -268,74 +301,124 @@ class ConnectionHandler:
         self.logger.bind(tag=TAG).debug(json.dumps(self.dialogue.get_llm_dialogue(), indent=4, ensure_ascii=False))
         return True
 
-    def _priority_thread(self):
+    def _fold_dialogue(self):
+        """对话超出token预算时移出最早的几轮，在后台合并成摘要，这一轮请求不等待摘要"""
+        # 对话历史保存在供应商一侧时只发送最后一条消息，移出的消息不需要摘要
+        summarize = not self.llm.remote_history
+        if not self.dialogue.fold(summarize) or not summarize:
+            return
+        if self.summary_task is None or self.summary_task.done():
+            self.summary_task = asyncio.create_task(self.dialogue.summarize(self.llm, self.session_id))
+
+    def _submit_tts(self, turn, text):
+        self.logger.bind(tag=TAG).info(f"segment_text: {text}")
+        self.recode_first_last_text(text)
+        self.tts_pipeline.put(turn, text, self.speak_and_play, text)
+
+    async def _playout_loop(self):
+        """按顺序取出合成好的句子，按实时速度发送给设备"""
         while not self.stop_event.is_set():
-            text = None
+            # 合成的超时和重试由流水线处理
+            tts_file, text = await self.tts_pipeline.get()
+            if text is None:
+                break
+            if len(text) <= 0 or self.client_abort:
+                continue
+            if tts_file is None:
+                self.logger.bind(tag=TAG).error(f"TTS文件生成失败: {text}")
+                continue
             try:
-                future = self.tts_queue.get()
-                if future is None:
-                    continue
-                text = None
-                try:
-                    self.logger.bind(tag=TAG).debug("正在处理TTS任务...")
-                    tts_file, text = future.result(timeout=10)
-                    if text is None or len(text) <= 0:
-                        continue
-                    if tts_file is None:
-                        self.logger.bind(tag=TAG).error(f"TTS文件生成失败: {text}")
-                        continue
-                    self.logger.bind(tag=TAG).debug(f"TTS文件生成完毕，文件路径: {tts_file}")
-                    if os.path.exists(tts_file):
-                        opus_datas, duration = self.tts.wav_to_opus_data(tts_file)
-                    else:
-                        self.logger.bind(tag=TAG).error(f"TTS文件不存在: {tts_file}")
-                        opus_datas = []
-                        duration = 0
-                except TimeoutError:
-                    self.logger.bind(tag=TAG).error("TTS 任务超时")
-                    continue
-                except Exception as e:
-                    self.logger.bind(tag=TAG).error(f"TTS 任务出错: {e}")
-                    continue
-                if not self.client_abort:
-                        #sleep_time = max(duration, 1 if len(text) <= 3 else len(text) * 0.2)
-                        # 使用实例锁来确保顺序传输
-                        self.logger.bind(tag=TAG).info(f"发送TTS语音: {text}, 时长:{duration}, sleep_time:{duration}")
-                        text = '';
-                        #asyncio.run_coroutine_threadsafe(
-                        #    sendAudioMessage(self, opus_datas, duration, text), self.loop
-                        #)
-                        future = asyncio.run_coroutine_threadsafe(
-                            sendAudioMessage(self, opus_datas, duration, text),
-                            self.loop
-                        )
-                        # 等待异步操作完成
-                        future.result()
-                        # 等待一段时间，确保音频播放完成
-
-                        time.sleep(duration)
-
-                #if self.tts.delete_audio_file and os.path.exists(tts_file):
-                #    os.remove(tts_file)
+                if isinstance(tts_file, OpusPacketStream):
+                    await self._play_stream(tts_file, text)
+                else:
+                    self.logger.bind(tag=TAG).info(f"发送TTS语音: {text}, 时长:{tts_file.duration}")
+                    await sendAudioMessage(self, tts_file.packets, tts_file.duration, text)
             except Exception as e:
-                self.logger.bind(tag=TAG).error(f"TTS任务处理错误: {e}")
+                self.logger.bind(tag=TAG).error(f"TTS任务处理错误: {text}: {e}")
                 self.clearSpeakStatus()
-                asyncio.run_coroutine_threadsafe(
-                    self.websocket.send(json.dumps({"type": "tts", "state": "stop", "session_id": self.session_id})),
-                    self.loop
+                await self.send_queue.send(
+                    json.dumps({"type": "tts", "state": "stop", "session_id": self.session_id}), urgent=True
                 )
-                self.logger.bind(tag=TAG).error(f"tts_priority priority_thread: {text}{e}")
 
-    def speak_and_play(self, text):
+    async def _play_stream(self, stream, text):
+        """流式合成：收到Opus包就按实时速度发送，不等整句合成完"""
+        started = False
+        duration = 0
+        try:
+            async for packets in stream.achunks(timeout=10):
+                if self.client_abort:
+                    stream.cancel()
+                    break
+                if not started:
+                    await sendSentenceStart(self, text)
+                    started = True
+                chunk_duration = len(packets) * stream.packet_duration
+                if not await sendAudioPackets(self, packets, chunk_duration):
+                    stream.cancel()
+                    break
+                duration += chunk_duration
+        except asyncio.TimeoutError:
+            stream.cancel()
+            self.logger.bind(tag=TAG).error(f"TTS 流式合成超时: {text}")
+        if stream.error is not None:
+            self.logger.bind(tag=TAG).error(f"TTS 流式合成出错: {text}: {stream.error}")
+        if started and not self.client_abort:
+            self.logger.bind(tag=TAG).info(f"发送TTS语音: {text}, 时长:{duration}")
+            await sendSentenceEnd(self, text)
+
+    async def speak_and_play(self, text, use_cache=True):
+        """合成一句；use_cache 为 False 时不查找也不写入TTS缓存（验证码等不会重复的句子）"""
         if text is None or len(text) <= 0:
             self.logger.bind(tag=TAG).info(f"无需tts转换，query为空，{text}")
             return None, text
-        tts_file = self.tts.to_tts(text)
-        if tts_file is None:
+        cache_key = self.tts_cache.key(self.tts, text) if self.tts_cache and use_cache else None
+        if cache_key is not None:
+            # 磁盘缓存的读取在连接的CPU任务队列中进行
+            audio = await self.tts_cache.get_async(cache_key, self.executor)
+            if audio is not None:
+                self.logger.bind(tag=TAG).debug(f"TTS缓存命中: {text}")
+                return audio, text
+        turn = TurnScope.current()
+        if self.tts.supports_stream:
+            # 流式合成在TTS事件循环中读取，编码在连接的CPU任务队列中进行，这里直接返回包队列，播放马上可以开始
+            stream = OpusPacketStream()
+            if turn is not None:
+                turn.add_stream(stream)
+            future = self.tts.start_opus_stream(text, stream, self.executor)
+            if turn is not None:
+                turn.track(future)
+            if cache_key is not None:
+                future.add_done_callback(lambda _: self._cache_stream(cache_key, stream))
+            return stream, text
+        tts_file = await self.tts.to_tts_async(text)
+        if turn is not None and turn.cancelled:
+            return None, text
+        if tts_file is None or not os.path.exists(tts_file):
             self.logger.bind(tag=TAG).error(f"tts转换失败，{text}")
             return None, text
         self.logger.bind(tag=TAG).debug(f"TTS 文件生成完毕: {tts_file}")
-        return tts_file, text
+        # Opus编码在共享的CPU工作线程中进行，播放端拿到后直接发送
+        audio = TTSAudio(*await asyncio.wrap_future(self.executor.submit(self.tts.wav_to_opus_data, tts_file)))
+        if cache_key is not None:
+            self.tts_cache.put(cache_key, audio, self.executor)
+        return audio, text
+
+    async def speak_auth_code(self, auth_code, text):
+        """用语音片段库拼接验证码播报，片段不可用时再整句合成"""
+        if self.phrase_bank is not None:
+            # 片段没有预加载时需要现场合成，放在默认线程池中，不占用CPU工作线程
+            audio = await self.loop.run_in_executor(
+                None, contextvars.copy_context().run, self.phrase_bank.auth_code, self.tts, auth_code
+            )
+            if audio is not None:
+                return audio, text
+        # 每台设备的验证码不同，整句合成的结果不写入缓存，避免挤掉常用的语音
+        return await self.speak_and_play(text, use_cache=False)
+
+    def _cache_stream(self, cache_key, stream):
+        # 完整合成的语音才写入缓存，被打断或出错的不写
+        if stream.closed and stream.error is None and not stream.cancelled:
+            self.tts_cache.put(cache_key, TTSAudio(stream.packets, stream.duration), self.executor)
 
     def clearSpeakStatus(self):
         self.logger.bind(tag=TAG).debug(f"清除服务端讲话状态")
@@ -354,13 +437,40 @@ class ConnectionHandler:
     async def close(self):
         """资源清理方法"""
         self.stop_event.set()
-        self.executor.shutdown(wait=False)
+        if self.turn is not None:
+            self.turn.cancel(self.tts_pipeline)
+        if self.tts_pipeline is not None:
+            self.tts_pipeline.close()
+        if self.playout is not None:
+            self.playout.interrupt()
+        if self.summary_task is not None:
+            self.summary_task.cancel()
+        if self.send_queue is not None:
+            self.send_queue.close()
+            # 已排队的消息（如最后的 stop）发出后再关闭 websocket，最多等待 close_timeout 秒
+            try:
+                if not self.send_task.done():
+                    await asyncio.wait_for(self.send_task, self.send_queue.close_timeout)
+            except asyncio.TimeoutError:
+                self.logger.bind(tag=TAG).warning(f"发送队列 {self.send_queue.close_timeout}s 内没有发完，直接关闭连接")
+            except Exception as e:
+                self.logger.bind(tag=TAG).error(f"发送任务出错: {e}")
+            self.logger.bind(tag=TAG).info(f"发送队列统计: {json.dumps(self.send_queue.stats())}")
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        # 还没识别完的流式识别块不再执行，不会向已关闭的连接下发部分结果
+        if self.asr_stream is not None:
+            self.asr_stream.reset()
+        # 归还VAD会话，供后续连接复用
+        if self.vad_session is not None:
+            self.vad.release_session(self.vad_session)
+            self.vad_session = None
         if self.websocket:
             await self.websocket.close()
         self.logger.bind(tag=TAG).info("连接资源已释放")
 
     def reset_vad_states(self):
-        self.client_audio_buffer = bytes()
+        self.client_audio_buffer.clear()
         self.client_have_voice = False
         self.client_have_voice_last_time = 0
         self.client_voice_stop = False
@@ -7,11 +7,11 @@ logger = setup_logging()
 
 async def handleAbortMessage(conn):
     logger.bind(tag=TAG).info("Abort message received")
-    # 设置成打断状态，会自动打断llm、tts任务
-    conn.client_abort = True
+    # 设置成打断状态，关闭LLM流并取消这一轮的TTS任务
+    conn.abort_turn()
     # 打断屏显任务
     conn.stop_all_tasks()
     # 打断客户端说话状态
-    await conn.websocket.send(json.dumps({"type": "tts", "state": "stop", "session_id": conn.session_id}))
+    await conn.send_queue.send(json.dumps({"type": "tts", "state": "stop", "session_id": conn.session_id}), urgent=True)
     conn.clearSpeakStatus()
     logger.bind(tag=TAG).info("Abort message received-end")
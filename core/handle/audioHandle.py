@@ -12,8 +12,12 @@ async def handleAudioMessage(conn, audio):
     if not conn.asr_server_receive:
         logger.bind(tag=TAG).debug(f"前期数据处理中，暂停接收")
         return
+    # 每个Opus包只解码一次，VAD和ASR共用解码后的PCM
+    pcm_frame = conn.vad.decode(conn, audio)
+    if pcm_frame is None:
+        return
     if conn.client_listen_mode == "auto":
-        have_voice = conn.vad.is_vad(conn, audio)
+        have_voice = await conn.vad.is_vad_async(conn, pcm_frame)
     else:
         have_voice = conn.client_have_voice
 
@@ -23,12 +27,18 @@ async def handleAudioMessage(conn, audio):
         conn.asr_audio.clear()
         return
     conn.client_no_voice_last_time = 0.0
-    conn.asr_audio.append(audio)
+    conn.asr_audio.append(pcm_frame)
+    if conn.asr_stream is not None:
+        # 流式识别：边说边识别，部分结果通过stt消息下发
+        conn.asr.stream_feed(conn.asr_stream, pcm_frame, lambda text: send_stt_partial_message(conn, text))
     # 如果本段有声音，且已经停止了
     if conn.client_voice_stop:
         conn.client_abort = False
         conn.asr_server_receive = False
-        text, file_path = conn.asr.speech_to_text(conn.asr_audio, conn.session_id)
+        if conn.asr_stream is not None:
+            text, file_path = await conn.asr.stream_finish(conn.asr_stream, conn.asr_audio.view(), conn.session_id)
+        else:
+            text, file_path = await conn.asr.speech_to_text_async(conn.asr_audio.view(), conn.session_id)
         logger.bind(tag=TAG).info(f"识别文本: {text}")
         text_len, text_without_punctuation = remove_punctuation_and_length(text)
         if text_len <= conn.max_cmd_length and await handleCMDMessage(conn, text_without_punctuation):
@@ -73,41 +83,55 @@ async def startToChat(conn, text):
         schedule_with_interrupt(0, send_stt_message(conn, text))
     )
     conn.scheduled_tasks.append(stt_task)
-    conn.executor.submit(conn.chat, text)
+    conn.start_turn(text)
 
 
 async def sendAudioMessage(conn, audios, duration, text):
-    base_delay = conn.tts_duration
-    #base_delay = 1 if len(text) <= 3 else len(text) * 0.35
-    # 发送 tts.start
-    if text == conn.tts_first_text:
+    """发送一句整句合成好的语音"""
+    await sendSentenceStart(conn, text)
+    if await sendAudioPackets(conn, audios, duration):
+        await sendSentenceEnd(conn, text)
+
+
+async def sendSentenceStart(conn, text):
+    # 记录第一句开始播放的时间
+    if conn.tts_start_speak_time is None:
         logger.bind(tag=TAG).info(f"发送第一段语音: {text}")
         conn.tts_start_speak_time = time.time()
+    # 发送 sentence_start（每句话之前发送一次），音频按实时速度发送，此时上一句即将播完
+    await send_tts_message(conn, "sentence_start", text)
 
-    # 发送 sentence_start（每个音频文件之前发送一次）
-    sentence_task = asyncio.create_task(
-        schedule_with_interrupt(base_delay, send_tts_message(conn, "sentence_start", text))
-    )
-    conn.scheduled_tasks.append(sentence_task)
 
-    conn.tts_duration += duration
+async def sendAudioPackets(conn, audios, duration):
+    """按实时速度发送Opus包，被打断时返回 False"""
+    if not audios:
+        return True
+    packet_duration = duration / len(audios)
+    sent = await conn.playout.play(audios, packet_duration)
+    conn.tts_duration += sent * packet_duration
+    return sent == len(audios)
 
-    # 发送音频数据
-    for idx, opus_packet in enumerate(audios):
-        await conn.websocket.send(opus_packet)
 
-    if conn.llm_finish_task and text == conn.tts_last_text:
-        stop_duration = conn.tts_duration - (time.time() - conn.tts_start_speak_time)
-        logger.bind(tag=TAG).info(f"llm_finish_task: {text}, stop_duration: {stop_duration}")
-        stop_task = asyncio.create_task(
-            schedule_with_interrupt(0, send_tts_message(conn, 'stop'))
+async def sendSentenceEnd(conn, text):
+    """最后一句发送完后，等设备播放完再发送 stop"""
+    if not (conn.llm_finish_task and text == conn.tts_last_text):
+        return
+    if not await conn.playout.drain():
+        return
+    # 设备接收慢时音频还在发送队列中，全部发出后再发送 stop
+    await conn.send_queue.wait_audio_sent()
+    if conn.client_abort:
+        return
+    play_time = time.time() - conn.tts_start_speak_time if conn.tts_start_speak_time else 0
+    logger.bind(tag=TAG).info(f"llm_finish_task: {text}, 语音时长: {conn.tts_duration:.2f}s, 播放耗时: {play_time:.2f}s")
+    # stop 会清除首句和末句，先判断是否要结束对话
+    want_finish = await isLLMWantToFinish(conn)
+    await send_tts_message(conn, 'stop')
+    if want_finish:
+        finish_task = asyncio.create_task(
+            schedule_with_interrupt(0, finishToChat(conn))
         )
-        conn.scheduled_tasks.append(stop_task)
-        if await isLLMWantToFinish(conn):
-            finish_task = asyncio.create_task(
-                schedule_with_interrupt(0, finishToChat(conn))
-            )
-            conn.scheduled_tasks.append(finish_task)
+        conn.scheduled_tasks.append(finish_task)
 
 
 async def send_tts_message(conn, state, text=None):
@@ -120,7 +144,8 @@ async def send_tts_message(conn, state, text=None):
     if text is not None:
         message["text"] = text
 
-    await conn.websocket.send(json.dumps(message))
+    # stop 插到排队的音频之前，其他状态消息与音频保持顺序
+    await conn.send_queue.send(json.dumps(message), urgent=state == "stop")
     if state == "stop":
         conn.clearSpeakStatus()
 
@@ -128,12 +153,12 @@ async def send_tts_message(conn, state, text=None):
 async def send_stt_message(conn, text):
     """发送 STT 状态消息"""
     stt_text = get_string_no_punctuation_or_emoji(text)
-    await conn.websocket.send(json.dumps({
+    await conn.send_queue.send(json.dumps({
         "type": "stt",
         "text": stt_text,
         "session_id": conn.session_id}
     ))
-    await conn.websocket.send(
+    await conn.send_queue.send(
         json.dumps({
             "type": "llm",
             "text": "😊",
@@ -143,6 +168,16 @@ async def send_stt_message(conn, text):
     await send_tts_message(conn, "start")
 
 
+async def send_stt_partial_message(conn, text):
+    """发送说话过程中的部分识别结果"""
+    await conn.send_queue.send(json.dumps({
+        "type": "stt",
+        "state": "partial",
+        "text": get_string_no_punctuation_or_emoji(text),
+        "session_id": conn.session_id}
+    ))
+
+
 async def schedule_with_interrupt(delay, coro):
     """可中断的延迟调度"""
     try:
@@ -5,4 +5,4 @@ logger = setup_logging()
 
 
 async def handleHelloMessage(conn):
-    await conn.websocket.send(json.dumps(conn.welcome_msg))
+    await conn.send_queue.send(json.dumps(conn.welcome_msg))
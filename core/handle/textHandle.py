@@ -14,7 +14,7 @@ async def handleTextMessage(conn, message):
     try:
         msg_json = json.loads(message)
         if isinstance(msg_json, int):
-            await conn.websocket.send(message)
+            await conn.send_queue.send(message)
             return
         if msg_json["type"] == "hello":
             await handleHelloMessage(conn)
@@ -34,7 +34,9 @@ async def handleTextMessage(conn, message):
                 conn.asr_server_receive = False
                 conn.client_have_voice = False
                 conn.asr_audio.clear()
+                if conn.asr_stream is not None:
+                    conn.asr_stream.reset()
                 if "text" in msg_json:
                     await startToChat(conn, msg_json["text"])
     except json.JSONDecodeError:
-        await conn.websocket.send(message)
+        await conn.send_queue.send(message)
@@ -1,8 +1,67 @@
+import asyncio
 from abc import ABC, abstractmethod
+from core.utils.tts_loop import run_in_thread_loop
 
 
 class LLMProviderBase(ABC):
+    """LLM供应商基类
+
+    同步供应商继承本类并实现 response（同步生成器），
+    response_async 由基类在线程池中逐块读取同步生成器。
+    原生异步的供应商继承 AsyncLLMProviderBase。
+    """
+
+    native_async = False
+    # 对话历史保存在供应商一侧（只发送最后一条用户消息）时为 True
+    remote_history = False
+
     @abstractmethod
-    def response(self, session_id, dialogue, headers):
+    def response(self, session_id, dialogue, headers=None):
         """LLM response generator"""
         pass
+
+    async def response_async(self, session_id, dialogue, headers=None):
+        """LLM 异步响应生成器"""
+        loop = asyncio.get_running_loop()
+        responses = self.response(session_id, dialogue, headers)
+        done = object()
+        try:
+            while True:
+                content = await loop.run_in_executor(None, next, responses, done)
+                if content is done:
+                    break
+                yield content
+        finally:
+            try:
+                await loop.run_in_executor(None, responses.close)
+            except ValueError:
+                # 被取消时线程中的 next 可能还在执行，生成器随后由垃圾回收关闭
+                pass
+
+
+class AsyncLLMProviderBase(LLMProviderBase):
+    """原生异步的LLM供应商基类
+
+    供应商实现 response_async（异步生成器），流式响应直接在连接的事件循环中读取，不占用线程；
+    response 由基类在调用线程复用的事件循环中逐块读取。
+    """
+
+    native_async = True
+
+    def response(self, session_id, dialogue, headers=None):
+        """LLM response generator"""
+        # 同步调用方（测试工具等）在调用线程复用的事件循环中逐块读取
+        responses = self.response_async(session_id, dialogue, headers)
+        try:
+            while True:
+                try:
+                    yield run_in_thread_loop(responses.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            run_in_thread_loop(responses.aclose())
+
+    @abstractmethod
+    async def response_async(self, session_id, dialogue, headers=None):
+        """LLM 异步响应生成器"""
+        yield
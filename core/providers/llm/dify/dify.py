@@ -1,24 +1,28 @@
 import json
 from config.logger import setup_logging
-import requests
-from core.providers.llm.base import LLMProviderBase
+from core.utils.http_client import get_async_client
+from core.providers.llm.base import AsyncLLMProviderBase
 
 TAG = __name__
 logger = setup_logging()
 
-class LLMProvider(LLMProviderBase):
+class LLMProvider(AsyncLLMProviderBase):
+    remote_history = True
+
     def __init__(self, config):
         self.api_key = config["api_key"]
         self.base_url = config.get("base_url", "https://api.dify.ai/v1").rstrip('/')
 
-    def response(self, session_id, dialogue, headers):
+    async def response_async(self, session_id, dialogue, headers=None):
         try:
             # 取最后一条用户消息
             last_msg = next(m for m in reversed(dialogue) if m["role"] == "user")
+            headers = headers or {}
             #device_id = self.headers.get("device-id", None)
             logger.bind(tag=TAG).info(f"headers: {headers}")
             # 发起流式请求
-            with requests.post(
+            async with get_async_client().stream(
+                    "POST",
                     f"{self.base_url}/chat-messages",
                     headers={"Authorization": f"Bearer {self.api_key}"},
                     json={
@@ -32,11 +36,10 @@ class LLMProvider(LLMProviderBase):
                             "x-forwarded-for": headers.get("x-forwarded-for", None),
                             "sec-websocket-key": headers.get("sec-websocket-key", None)
                         }
-                    },
-                    stream=True
+                    }
             ) as r:
-                for line in r.iter_lines():
-                    if line.startswith(b'data: '):
+                async for line in r.aiter_lines():
+                    if line.startswith('data: '):
                         event = json.loads(line[6:])
                         if event.get('answer'):
                             yield event['answer']
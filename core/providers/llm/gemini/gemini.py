@@ -32,7 +32,7 @@ class LLMProvider(LLMProviderBase):
             logger.bind(tag=TAG).error(f"Gemini初始化失败: {e}")
             self.model = None
 
-    def response(self, session_id, dialogue):
+    def response(self, session_id, dialogue, headers=None):
         """生成Gemini对话响应"""
         if not self.model:
             yield "【Gemini服务未正确初始化】"
@@ -1,20 +1,22 @@
-import requests
-from requests.exceptions import RequestException
+import httpx
 from config.logger import setup_logging
-from core.providers.llm.base import LLMProviderBase
+from core.providers.llm.base import AsyncLLMProviderBase
+from core.utils.http_client import get_async_client
 
 TAG = __name__
 logger = setup_logging()
 
 
-class LLMProvider(LLMProviderBase):
+class LLMProvider(AsyncLLMProviderBase):
+    remote_history = True
+
     def __init__(self, config):
         self.agent_id = config.get("agent_id")  # 对应 agent_id
         self.api_key = config.get("api_key")
         self.base_url = config.get("base_url", config.get("url"))  # 默认使用 base_url
         self.api_url = f"{self.base_url}/api/conversation/process"  # 拼接完整的 API URL
 
-    def response(self, session_id, dialogue):
+    async def response_async(self, session_id, dialogue, headers=None):
         print(dialogue)
         try:
             # home assistant语音助手自带意图，无需使用xiaozhi ai自带的，只需要把用户说的话传递给home assistant即可
@@ -41,7 +43,7 @@ class LLMProvider(LLMProviderBase):
             }
 
             # 发起 POST 请求
-            response = requests.post(self.api_url, json=payload, headers=headers)
+            response = await get_async_client().post(self.api_url, json=payload, headers=headers)
 
             # 检查请求是否成功
             response.raise_for_status()
@@ -56,7 +58,7 @@ class LLMProvider(LLMProviderBase):
             else:
                 logger.bind(tag=TAG).warning("API 返回数据中没有 speech 内容")
 
-        except RequestException as e:
+        except httpx.HTTPError as e:
             logger.bind(tag=TAG).error(f"HTTP 请求错误: {e}")
         except Exception as e:
             logger.bind(tag=TAG).error(f"生成响应时出错: {e}")
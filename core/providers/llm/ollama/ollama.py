@@ -1,18 +1,20 @@
 from config.logger import setup_logging
-import requests, json
-from core.providers.llm.base import LLMProviderBase
+import json
+from core.utils.http_client import get_async_client
+from core.providers.llm.base import AsyncLLMProviderBase
 
 TAG = __name__
 logger = setup_logging()
 
 
-class LLMProvider(LLMProviderBase):
+class LLMProvider(AsyncLLMProviderBase):
+
     def __init__(self, config):
 
         self.model_name = config.get("model_name")
         self.base_url = config.get("base_url", "http://localhost:11434")
 
-    def response(self, session_id, dialogue):        
+    async def response_async(self, session_id, dialogue, headers=None):
         try:
             # Convert dialogue format to Ollama format
             prompt = ""
@@ -25,21 +27,20 @@ class LLMProvider(LLMProviderBase):
                     prompt += f"Assistant: {msg['content']}\n"
 
             # Make request to Ollama API
-            response = requests.post(
+            async with get_async_client().stream(
+                "POST",
                 f"{self.base_url}/api/generate",
                 json={
                     "model": self.model_name,
                     "prompt": prompt,
                     "stream": True
-                },
-                stream=True
-            )
-
-            for line in response.iter_lines():
-                if line:
-                    json_response = json.loads(line)
-                    if "response" in json_response:
-                        yield json_response["response"]
+                }
+            ) as response:
+                async for line in response.aiter_lines():
+                    if line:
+                        json_response = json.loads(line)
+                        if "response" in json_response:
+                            yield json_response["response"]
 
         except Exception as e:
             logger.bind(tag=TAG).error(f"Error in Ollama response generation: {e}")
@@ -1,12 +1,14 @@
 from config.logger import setup_logging
 import openai
-from core.providers.llm.base import LLMProviderBase
+from core.providers.llm.base import AsyncLLMProviderBase
+from core.utils.http_client import get_async_client
 
 TAG = __name__
 logger = setup_logging()
 
 
-class LLMProvider(LLMProviderBase):
+class LLMProvider(AsyncLLMProviderBase):
+
     def __init__(self, config):
         self.model_name = config.get("model_name")
         self.api_key = config.get("api_key")
@@ -16,16 +18,17 @@ class LLMProvider(LLMProviderBase):
             self.base_url = config.get("url")
         if "你" in self.api_key:
             logger.bind(tag=TAG).error("你还没配置LLM的密钥，请在配置文件中配置密钥，否则无法正常工作")
-        self.client = openai.OpenAI(api_key=self.api_key, base_url=self.base_url)
 
-    def response(self, session_id, dialogue):
+    async def response_async(self, session_id, dialogue, headers=None):
         try:
-            responses = self.client.chat.completions.create(
+            # 客户端对象很轻，连接池由当前事件循环共享的HTTP客户端提供
+            client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, http_client=get_async_client())
+            responses = await client.chat.completions.create(
                 model=self.model_name,
                 messages=dialogue,
                 stream=True
             )
-            for chunk in responses:
+            async for chunk in responses:
                 # 检查是否存在有效的choice且content不为空
                 if chunk.choices and len(chunk.choices) > 0:
                     delta = chunk.choices[0].delta
@@ -1,21 +1,26 @@
 import os
 import uuid
 import json
-import requests
 from datetime import datetime
 from core.providers.tts.base import TTSProviderBase
+from core.utils.http_client import get_async_client
 
 import http.client
 import urllib.parse
 
 
 class TTSProvider(TTSProviderBase):
+    native_async = True
+    output_formats = ("pcm", "wav", "mp3")
+
     def __init__(self, config, delete_audio_file):
         super().__init__(config, delete_audio_file)
         self.appkey = config.get("appkey")
         self.token = config.get("token")
-        self.format = config.get("format", "wav")
+        # 兼容旧配置：format 指定了格式时不再协商
+        self.preferred_output_format = config.get("output_format", config.get("format"))
         self.sample_rate = config.get("sample_rate", 16000)
+        self.output_sample_rate = self.sample_rate
         self.voice = config.get("voice", "xiaoyun")
         self.volume = config.get("volume", 50)
         self.speech_rate = config.get("speech_rate", 0)
@@ -35,7 +40,7 @@ class TTSProvider(TTSProviderBase):
             "appkey": self.appkey,
             "token": self.token,
             "text": text,
-            "format": self.format,
+            "format": self.output_format,
             "sample_rate": self.sample_rate,
             "voice": self.voice,
             "volume": self.volume,
@@ -45,7 +50,7 @@ class TTSProvider(TTSProviderBase):
 
         print(self.api_url, json.dumps(request_json, ensure_ascii=False))
         try:
-            resp = requests.post(self.api_url, json.dumps(request_json), headers=self.header)
+            resp = await get_async_client().post(self.api_url, content=json.dumps(request_json), headers=self.header)
             # 检查返回请求数据的mime类型是否是audio/***，是则保存到指定路径下；返回的是binary格式的
             if resp.headers['Content-Type'].startswith('audio/'):
                 with open(output_file, 'wb') as f:
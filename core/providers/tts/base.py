@@ -1,85 +1,235 @@
 import asyncio
+import contextvars
+import json
 from config.logger import setup_logging
 import os
 import numpy as np
-import opuslib_next
-from pydub import AudioSegment
 from abc import ABC, abstractmethod
 import time
+from concurrent.futures import CancelledError
+from core.utils.tts_loop import TTSEventLoop, run_in_thread_loop
+from core.utils.turn import TurnScope
+from core.utils.audio import (
+    downmix, read_wav, read_pcm, decode_with_ffmpeg, pcm_to_opus,
+    PolyphaseResampler, OpusStreamEncoder, FFmpegStreamDecoder, OpusPacketStream, OPUS_SAMPLE_RATE
+)
 
 TAG = __name__
 logger = setup_logging()
 
+# 各音频格式在服务端的处理开销，从低到高：
+# opus 为设备参数（16kHz单声道、60ms一帧）的Opus包，直接发送；pcm 直接编码；
+# wav 解析文件头后编码；其他压缩格式（mp3等）需要ffmpeg解码
+OUTPUT_FORMAT_COST = ("opus", "pcm", "wav")
+# 被取消后等待线程中的合成结束的最长时间(秒)，超过后不再等待，线程留在后台直到请求返回
+CANCEL_WAIT_SECONDS = 10
+
 
 class TTSProviderBase(ABC):
+    # text_to_speak 是否为真正的异步实现（不含阻塞调用）。是则在共享的TTS事件循环中执行，
+    # 否则在调用线程中同步执行
+    native_async = False
+    # 供应商能输出的音频格式，由 negotiate_output_format 从中选出开销最低的一种
+    output_formats = ("wav",)
+    # pcm 格式的采样率和声道数，供应商不是按设备采样率输出时由服务端重采样
+    output_sample_rate = OPUS_SAMPLE_RATE
+    output_channels = 1
+    # 是否支持流式合成。为 True 的供应商需实现 async generator text_to_speak_stream(text)，
+    # 边合成边返回 output_format 格式的音频数据块，opus 格式每块是一个Opus包
+    supports_stream = False
+
     def __init__(self, config, delete_audio_file):
         self.delete_audio_file = delete_audio_file
         self.output_file = config.get("output_file")
+        # 配置了 output_format 时优先使用该格式，否则由服务端协商
+        self.preferred_output_format = config.get("output_format")
+        self.output_format = None
+        # 每个连接同时预取合成的句子数，未配置时使用 tts_pipeline 中的设置
+        self.prefetch = config.get("prefetch")
+        # 供应商和音色等配置相同时合成结果相同，作为TTS缓存键的一部分
+        self.cache_identity = json.dumps(
+            {"provider": type(self).__module__,
+             **{k: v for k, v in config.items() if k not in ("output_file", "prefetch")}},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+
+    def negotiate_output_format(self):
+        """在供应商支持的格式中选择开销最低的一种"""
+        candidates = [fmt for fmt in self.output_formats if fmt != "opus" or self.supports_stream]
+        if self.preferred_output_format in candidates:
+            self.output_format = self.preferred_output_format
+        else:
+            self.output_format = min(
+                candidates,
+                key=lambda fmt: OUTPUT_FORMAT_COST.index(fmt) if fmt in OUTPUT_FORMAT_COST else len(OUTPUT_FORMAT_COST)
+            )
+        return self.output_format
 
     @abstractmethod
-    def generate_filename(self):
+    def generate_filename(self, extension=".wav"):
         pass
 
     def to_tts(self, text):
-        tmp_file = self.generate_filename()
         try:
-            max_repeat_time = 5
-            while not os.path.exists(tmp_file) and max_repeat_time > 0:
-                asyncio.run(self.text_to_speak(text, tmp_file))
-                if not os.path.exists(tmp_file):
-                    max_repeat_time = max_repeat_time - 1
-                    logger.bind(tag=TAG).error(f"语音生成失败: {text}:{tmp_file}，再试{max_repeat_time}次")
-
-            if max_repeat_time > 0:
-                logger.bind(tag=TAG).info(f"语音生成成功: {text}:{tmp_file}，重试{5 - max_repeat_time}次")
-
-            return tmp_file
+            return self.run_coroutine(self._synthesize_file(text))
+        except CancelledError:
+            logger.bind(tag=TAG).info(f"语音合成已取消: {text}")
+            return None
         except Exception as e:
             logger.bind(tag=TAG).info(f"Failed to generate TTS file: {e}")
             return None
 
-    @abstractmethod
-    async def text_to_speak(self, text, output_file):
-        pass
-
-    def wav_to_opus_data(self, wav_file_path):
-        # 使用pydub加载PCM文件
-        # 获取文件后缀名
-        file_type = os.path.splitext(wav_file_path)[1]
-        if file_type:
-            file_type = file_type.lstrip('.')
-        audio = AudioSegment.from_file(wav_file_path, format=file_type)
-
-        duration = len(audio) / 1000.0
-
-        # 转换为单声道和16kHz采样率（确保与编码器匹配）
-        audio = audio.set_channels(1).set_frame_rate(16000)
-
-        # 获取原始PCM数据（16位小端）
-        raw_data = audio.raw_data
-
-        # 初始化Opus编码器
-        encoder = opuslib_next.Encoder(16000, 1, opuslib_next.APPLICATION_AUDIO)
+    async def to_tts_async(self, text):
+        """在调用方的事件循环中等待合成完成，不占用线程；调用方被取消时合成请求一起取消"""
+        if not self.native_async:
+            # 带上调用方的上下文，线程中 TurnScope.current() 仍是所属的对话轮次
+            future = asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, self.to_tts, text)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 线程中的合成无法中断，等它结束后再返回，调用方的超时重试不会与它同时进行；
+                # 供应商请求卡住时最多等待 CANCEL_WAIT_SECONDS
+                done, _ = await asyncio.wait([future], timeout=CANCEL_WAIT_SECONDS)
+                if not done:
+                    logger.bind(tag=TAG).warning(f"语音合成线程 {CANCEL_WAIT_SECONDS}s 内没有结束，不再等待: {text}")
+                raise
+        try:
+            return await asyncio.wrap_future(TTSEventLoop.get_instance().submit(self._synthesize_file(text)))
+        except Exception as e:
+            logger.bind(tag=TAG).info(f"Failed to generate TTS file: {e}")
+            return None
 
-        # 编码参数
-        frame_duration = 60  # 60ms per frame
-        frame_size = int(16000 * frame_duration / 1000)  # 960 samples/frame
+    async def _synthesize_file(self, text):
+        if self.output_format is None:
+            self.negotiate_output_format()
+        tmp_file = self.generate_filename(f".{self.output_format}")
+        max_repeat_time = 5
+        while not os.path.exists(tmp_file) and max_repeat_time > 0:
+            await self.text_to_speak(text, tmp_file)
+            if not os.path.exists(tmp_file):
+                max_repeat_time = max_repeat_time - 1
+                logger.bind(tag=TAG).error(f"语音生成失败: {text}:{tmp_file}，再试{max_repeat_time}次")
 
-        opus_datas = []
-        # 按帧处理所有音频数据（包括最后一帧可能补零）
-        for i in range(0, len(raw_data), frame_size * 2):  # 16bit=2bytes/sample
-            # 获取当前帧的二进制数据
-            chunk = raw_data[i:i + frame_size * 2]
+        if max_repeat_time > 0:
+            logger.bind(tag=TAG).info(f"语音生成成功: {text}:{tmp_file}，重试{5 - max_repeat_time}次")
 
-            # 如果最后一帧不足，补零
-            if len(chunk) < frame_size * 2:
-                chunk += b'\x00' * (frame_size * 2 - len(chunk))
+        return tmp_file
 
-            # 转换为numpy数组处理
-            np_frame = np.frombuffer(chunk, dtype=np.int16)
+    @abstractmethod
+    async def text_to_speak(self, text, output_file):
+        pass
 
-            # 编码Opus数据
-            opus_data = encoder.encode(np_frame.tobytes(), frame_size)
-            opus_datas.append(opus_data)
+    def run_coroutine(self, coro):
+        """在调用线程中同步等待TTS协程执行完成"""
+        if self.native_async:
+            future = TTSEventLoop.get_instance().submit(coro)
+            # 登记到所属的对话轮次，打断时取消正在进行的请求
+            turn = TurnScope.current()
+            if turn is not None:
+                turn.track(future)
+            return future.result()
+        return run_in_thread_loop(coro)
+
+    def to_opus_stream(self, text, stream: OpusPacketStream, executor=None):
+        """在当前线程中流式合成，编码好的Opus包陆续放入 stream"""
+        try:
+            self.run_coroutine(self._stream_and_close(text, stream, executor))
+        except CancelledError:
+            # 还没开始就被取消时协程不会执行，这里关闭
+            stream.cancel()
+            stream.close()
+
+    def start_opus_stream(self, text, stream: OpusPacketStream, executor=None):
+        """在调用方的事件循环中开始流式合成，立即返回 asyncio.Future；取消它会取消合成请求
+
+        executor 为连接的CPU任务队列，重采样和Opus编码在其中执行，事件循环中只读取网络数据
+        """
+        if not self.native_async:
+            return asyncio.get_running_loop().run_in_executor(
+                None, contextvars.copy_context().run, self.to_opus_stream, text, stream, executor
+            )
+        return asyncio.wrap_future(TTSEventLoop.get_instance().submit(self._stream_and_close(text, stream, executor)))
+
+    async def _stream_and_close(self, text, stream: OpusPacketStream, executor=None):
+        error = None
+        try:
+            await self._stream_opus(text, stream, executor)
+        except asyncio.CancelledError:
+            stream.cancel()
+            raise
+        except Exception as e:
+            error = e
+            logger.bind(tag=TAG).error(f"流式语音合成失败: {text}: {e}")
+        finally:
+            stream.close(error)
+
+    async def _stream_opus(self, text, stream: OpusPacketStream, executor=None):
+        if self.output_format is None:
+            self.negotiate_output_format()
+        encoder = OpusStreamEncoder()
+
+        async def run_cpu(fn, *args):
+            # 共享的TTS事件循环只做网络读写，编码放到连接的CPU任务队列
+            if executor is None:
+                return fn(*args)
+            return await asyncio.wrap_future(executor.submit(fn, *args))
+
+        chunks = self.text_to_speak_stream(text)
+        if self.output_format == "opus":
+            # 供应商直接输出设备格式的Opus包，不需要在服务端解码和编码
+            async for packet in chunks:
+                if stream.cancelled:
+                    return
+                stream.put([packet])
+            return
+        if self.output_format == "pcm":
+            resampler = PolyphaseResampler(self.output_sample_rate, OPUS_SAMPLE_RATE)
+            pending = b""
+
+            def encode_pcm(data):
+                samples = downmix(np.frombuffer(data, dtype=np.int16), self.output_channels)
+                return encoder.encode(resampler.process(samples))
+
+            async for chunk in chunks:
+                if stream.cancelled:
+                    return
+                # 数据块可能不在采样点边界上断开，多出的字节留到下一块
+                data = pending + chunk
+                usable = len(data) - len(data) % (2 * self.output_channels)
+                pending = data[usable:]
+                stream.put(await run_cpu(encode_pcm, data[:usable]))
+            stream.put(await run_cpu(lambda: encoder.encode(resampler.flush())))
+        else:
+            decoder = FFmpegStreamDecoder(self.output_format)
+            await decoder.start()
+
+            async def feed():
+                try:
+                    async for chunk in chunks:
+                        if stream.cancelled:
+                            break
+                        await decoder.write(chunk)
+                finally:
+                    await decoder.close_input()
+
+            feeder = asyncio.create_task(feed())
+            try:
+                async for pcm in decoder.read():
+                    if stream.cancelled:
+                        break
+                    stream.put(await run_cpu(encoder.encode, pcm))
+                await feeder
+            finally:
+                feeder.cancel()
+                decoder.kill()
+        stream.put(await run_cpu(encoder.flush))
 
-        return opus_datas, duration
+    def wav_to_opus_data(self, wav_file_path):
+        if wav_file_path.endswith(".pcm"):
+            # 没有文件头的PCM，采样率和声道数由供应商声明
+            return pcm_to_opus(read_pcm(wav_file_path, self.output_sample_rate, self.output_channels))
+        # 16位PCM的WAV直接读取，其他格式才交给pydub调用ffmpeg解码
+        samples = read_wav(wav_file_path)
+        if samples is None:
+            samples = decode_with_ffmpeg(wav_file_path)
+        return pcm_to_opus(samples)
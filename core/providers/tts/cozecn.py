@@ -2,12 +2,14 @@ import os
 import uuid
 import json
 import base64
-import requests
 from datetime import datetime
 from core.providers.tts.base import TTSProviderBase
+from core.utils.http_client import get_async_client
 
 
 class TTSProvider(TTSProviderBase):
+    native_async = True
+
     def __init__(self, config, delete_audio_file):
         super().__init__(config, delete_audio_file)
         self.model = config.get("model")
@@ -32,7 +34,7 @@ class TTSProvider(TTSProviderBase):
             "Authorization": f"Bearer {self.access_token}",
             "Content-Type": "application/json"
         }
-        response = requests.request("POST", self.api_url, json=request_json, headers=headers)
+        response = await get_async_client().post(self.api_url, json=request_json, headers=headers)
         data = response.content
-        file_to_save = open(output_file, "wb")
-        file_to_save.write(data)
+        with open(output_file, "wb") as file_to_save:
+            file_to_save.write(data)
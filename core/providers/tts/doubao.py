@@ -2,13 +2,16 @@ import os
 import uuid
 import json
 import base64
-import requests
 from datetime import datetime
 from core.providers.tts.base import TTSProviderBase
+from core.utils.http_client import get_async_client
 from config.logger import setup_logging
 
 TAG = __name__
 class TTSProvider(TTSProviderBase):
+    native_async = True
+    output_formats = ("pcm", "wav", "mp3")
+
     def __init__(self, config, delete_audio_file):
         super().__init__(config, delete_audio_file)
         self.appid = config.get("appid")
@@ -35,11 +38,11 @@ class TTSProvider(TTSProviderBase):
             },
             "audio": {
                 "voice_type": self.voice,
-                "encoding": "wav",
+                "encoding": self.output_format,
                 "speed_ratio": 1.0,
                 "volume_ratio": 1.0,
                 "pitch_ratio": 1.0,
-                "rate": 16000,
+                "rate": self.output_sample_rate,
             },
             "request": {
                 "reqid": str(uuid.uuid4()),
@@ -51,8 +54,8 @@ class TTSProvider(TTSProviderBase):
             }
         }
 
-        resp = requests.post(self.api_url, json.dumps(request_json), headers=self.header)
+        resp = await get_async_client().post(self.api_url, content=json.dumps(request_json), headers=self.header)
         if "data" in resp.json():
             data = resp.json()["data"]
-            file_to_save = open(output_file, "wb")
-            file_to_save.write(base64.b64decode(data))
+            with open(output_file, "wb") as file_to_save:
+                file_to_save.write(base64.b64decode(data))
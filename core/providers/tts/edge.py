@@ -6,6 +6,10 @@ from core.providers.tts.base import TTSProviderBase
 
 
 class TTSProvider(TTSProviderBase):
+    native_async = True
+    output_formats = ("mp3",)
+    supports_stream = True
+
     def __init__(self, config, delete_audio_file):
         super().__init__(config, delete_audio_file)
         self.voice = config.get("voice")
@@ -16,3 +20,9 @@ class TTSProvider(TTSProviderBase):
     async def text_to_speak(self, text, output_file):
         communicate = edge_tts.Communicate(text, voice=self.voice)  # Use your preferred voice
         await communicate.save(output_file)
+
+    async def text_to_speak_stream(self, text):
+        communicate = edge_tts.Communicate(text, voice=self.voice)
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                yield chunk["data"]
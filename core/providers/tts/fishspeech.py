@@ -2,7 +2,6 @@
 import base64
 import os
 import uuid
-import requests
 import ormsgpack
 from pathlib import Path
 from pydantic import BaseModel, Field, conint, model_validator
@@ -10,6 +9,7 @@ from typing_extensions import Annotated
 from datetime import datetime
 from typing import Literal
 from core.providers.tts.base import TTSProviderBase
+from core.utils.http_client import get_async_client
 from config.logger import setup_logging
 
 TAG = __name__
@@ -78,6 +78,8 @@ def read_ref_text(ref_text):
     return ref_text
 
 class TTSProvider(TTSProviderBase):
+    native_async = True
+    output_formats = ("pcm", "wav", "mp3")
 
     def __init__(self, config, delete_audio_file):
         super().__init__(config, delete_audio_file)
@@ -85,9 +87,13 @@ class TTSProvider(TTSProviderBase):
         self.reference_id = config.get("reference_id")
         self.reference_audio = config.get("reference_audio",[]) 
         self.reference_text = config.get("reference_text",[])
-        self.format =  config.get("format","wav")
+        # 兼容旧配置：format 指定了格式时不再协商
+        self.preferred_output_format = config.get("output_format", config.get("format"))
         self.channels = config.get("channels",1)
         self.rate = config.get("rate",44100)
+        # pcm 按模型的采样率输出，由服务端重采样
+        self.output_sample_rate = self.rate
+        self.output_channels = self.channels
         self.api_key = config.get("api_key","YOUR_API_KEY")
         if not self.api_key or "你" in self.api_key:
             logger.bind(tag=TAG).error("你还没配置FishSpeech TTS的密钥，请在配置文件中配置密钥，否则无法正常工作")
@@ -121,7 +127,7 @@ class TTSProvider(TTSProviderBase):
             ],
             "reference_id": self.reference_id,
             "normalize": self.normalize,
-            "format": self.format,
+            "format": self.output_format,
             "max_new_tokens": self.max_new_tokens,
             "chunk_length": self.chunk_length,
             "top_p": self.top_p,
@@ -134,9 +140,9 @@ class TTSProvider(TTSProviderBase):
 
         pydantic_data = ServeTTSRequest(**data)
 
-        response = requests.post(
+        response = await get_async_client().post(
             self.api_url,
-            data=ormsgpack.packb(pydantic_data, option=ormsgpack.OPT_SERIALIZE_PYDANTIC),
+            content=ormsgpack.packb(pydantic_data, option=ormsgpack.OPT_SERIALIZE_PYDANTIC),
             headers={
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/msgpack",
@@ -152,7 +158,6 @@ class TTSProvider(TTSProviderBase):
 
 
         else:
-            print(f"Request failed with status code {response.status_code}")
-            print(response.json())
+            logger.bind(tag=TAG).error(f"FishSpeech TTS请求失败: {response.status_code} - {response.text}")
 
 
@@ -2,15 +2,17 @@ import os
 import uuid
 import json
 import base64
-import requests
 from config.logger import setup_logging
 from datetime import datetime
 from core.providers.tts.base import TTSProviderBase
+from core.utils.http_client import get_async_client
 
 TAG = __name__
 logger = setup_logging()
 
 class TTSProvider(TTSProviderBase):
+    native_async = True
+
     def __init__(self, config, delete_audio_file):
         super().__init__(config, delete_audio_file)
         self.url = config.get("url")
@@ -59,7 +61,7 @@ class TTSProvider(TTSProviderBase):
             "repetition_penalty": self.repetition_penalty
         }
 
-        resp = requests.post(self.url, json=request_json)
+        resp = await get_async_client().post(self.url, json=request_json)
         if resp.status_code == 200:
             with open(output_file, "wb") as file:
                 file.write(resp.content)
@@ -1,12 +1,15 @@
 import os
 import uuid
 import json
-import requests
 from datetime import datetime
 from core.providers.tts.base import TTSProviderBase
+from core.utils.http_client import get_async_client
 
 
 class TTSProvider(TTSProviderBase):
+    native_async = True
+    output_formats = ("pcm", "wav", "mp3")
+
     def __init__(self, config, delete_audio_file):
         super().__init__(config, delete_audio_file)
         self.group_id = config.get("group_id")
@@ -36,6 +39,10 @@ class TTSProvider(TTSProviderBase):
         self.pronunciation_dict = {**default_pronunciation_dict, **config.get("pronunciation_dict", {})}
         self.audio_setting = {**defult_audio_setting, **config.get("audio_setting", {})}
         self.timber_weights = config.get("timber_weights", [])
+        # 兼容旧配置：audio_setting 中指定了格式时不再协商
+        self.preferred_output_format = config.get("output_format", config.get("audio_setting", {}).get("format"))
+        self.output_sample_rate = self.audio_setting["sample_rate"]
+        self.output_channels = self.audio_setting["channel"]
 
         if self.voice_id:
             self.voice_setting["voice_id"] = self.voice_id
@@ -57,7 +64,7 @@ class TTSProvider(TTSProviderBase):
             "stream": False,
             "voice_setting": self.voice_setting,
             "pronunciation_dict": self.pronunciation_dict,
-            "audio_setting": self.audio_setting,
+            "audio_setting": {**self.audio_setting, "format": self.output_format},
         }
 
         if type(self.timber_weights) is list and len(self.timber_weights) > 0:
@@ -65,12 +72,12 @@ class TTSProvider(TTSProviderBase):
             request_json["voice_setting"]["voice_id"] = ""
 
         try:
-            resp = requests.post(self.api_url, json.dumps(request_json), headers=self.header)
+            resp = await get_async_client().post(self.api_url, content=json.dumps(request_json), headers=self.header)
             # 检查返回请求数据的status_code是否为0
             if resp.json()["base_resp"]["status_code"] == 0:
                 data = resp.json()['data']['audio']
-                file_to_save = open(output_file, "wb")
-                file_to_save.write(bytes.fromhex(data))
+                with open(output_file, "wb") as file_to_save:
+                    file_to_save.write(bytes.fromhex(data))
             else:
                 raise Exception(f"{__name__} status_code: {resp.status_code} response: {resp.content}")
         except Exception as e:
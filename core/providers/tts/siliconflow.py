@@ -1,18 +1,23 @@
 import os
 import uuid
-import requests
 from datetime import datetime
 from core.providers.tts.base import TTSProviderBase
+from core.utils.http_client import get_async_client
 
 
 class TTSProvider(TTSProviderBase):
+    native_async = True
+    output_formats = ("pcm", "wav", "mp3")
+
     def __init__(self, config, delete_audio_file):
         super().__init__(config, delete_audio_file)
         self.model = config.get("model")
         self.access_token = config.get("access_token")
         self.voice = config.get("voice")
-        self.response_format = config.get("response_format")
+        # 兼容旧配置：response_format 指定了格式时不再协商
+        self.preferred_output_format = config.get("output_format", config.get("response_format"))
         self.sample_rate = config.get("sample_rate")
+        self.output_sample_rate = self.sample_rate or 16000
         self.speed = config.get("speed")
         self.gain = config.get("gain")
 
@@ -27,13 +32,15 @@ class TTSProvider(TTSProviderBase):
             "model": self.model,
             "input": text,
             "voice": self.voice,
-            "response_format": self.response_format,
+            "response_format": self.output_format,
         }
+        if self.output_format == "pcm" or self.sample_rate:
+            request_json["sample_rate"] = self.output_sample_rate
         headers = {
             "Authorization": f"Bearer {self.access_token}",
             "Content-Type": "application/json"
         }
-        response = requests.request("POST", self.api_url, json=request_json, headers=headers)
+        response = await get_async_client().post(self.api_url, json=request_json, headers=headers)
         data = response.content
-        file_to_save = open(output_file, "wb")
-        file_to_save.write(data)
+        with open(output_file, "wb") as file_to_save:
+            file_to_save.write(data)
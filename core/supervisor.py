@@ -0,0 +1,150 @@
+import os
+import gc
+import json
+import time
+import signal
+from config.logger import setup_logging
+from core.utils import http_client
+
+TAG = __name__
+
+
+def read_memory(pid):
+    """读取进程的内存占用(MB)：rss 为常驻内存，pss 按共享进程数分摊共享页，private 为独占的页"""
+    memory = {"rss": 0.0, "pss": 0.0, "private": 0.0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                if key == "Rss":
+                    memory["rss"] = int(value.split()[0]) / 1024
+                elif key == "Pss":
+                    memory["pss"] = int(value.split()[0]) / 1024
+                elif key in ("Private_Clean", "Private_Dirty"):
+                    memory["private"] += int(value.split()[0]) / 1024
+    except (OSError, ValueError):
+        pass
+    return memory
+
+
+class Supervisor:
+    """多进程模式的主进程
+
+    主进程只加载一次VAD、ASR等模型，然后 fork 出多个工作进程。模型权重在 fork 后以写时复制的方式共享，
+    推理不会修改权重，各进程不会各自持有一份。每个工作进程运行独立的事件循环，
+    通过 SO_REUSEPORT 监听同一个端口，由内核把新连接分给各个进程，推理和连接处理不再共用一个GIL。
+    工作进程异常退出时重新 fork，定期输出各进程的内存占用。仅支持 Linux。
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.logger = setup_logging()
+        server_config = config["server"]
+        workers = server_config.get("workers", 1)
+        if workers == "auto":
+            workers = os.cpu_count() or 1
+        self.workers = max(1, int(workers))
+        # 工作进程按实际进程数分摊TTS磁盘缓存等资源
+        config["server"] = dict(server_config, workers=self.workers)
+        self.stats_interval = server_config.get("worker_stats_interval", 60)
+        self.instances = None
+        self._children = {}  # pid -> 工作进程序号
+        self._stopping = False
+
+    def run(self, worker):
+        """加载模型并启动工作进程，worker(index, instances) 在工作进程中运行服务，阻塞到收到退出信号"""
+        from core.websocket_server import create_processing_instances
+
+        http_client.configure(self.config.get("http_client", {}))
+        asr_name = self.config["selected_module"]["ASR"]
+        if self.config["ASR"][asr_name].get("process_workers", 0):
+            # ASR进程池属于主进程，fork 出的工作进程无法使用；多进程模式下各工作进程直接识别
+            self.logger.bind(tag=TAG).warning("多进程模式下不使用 ASR process_workers，识别在各工作进程中进行")
+            self.config["ASR"][asr_name] = dict(self.config["ASR"][asr_name], process_workers=0)
+        self.instances = create_processing_instances(self.config)
+        parent = read_memory(os.getpid())
+        self.logger.bind(tag=TAG).info(f"模型加载完成，主进程内存 {parent['rss']:.1f}MB，启动 {self.workers} 个工作进程")
+        # 模型对象不再被回收，避免垃圾回收扫描时写入对象头，使共享的内存页被复制
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        for index in range(self.workers):
+            self._spawn(index, worker)
+
+        last_stats = time.monotonic()
+        while self._children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                if time.monotonic() - last_stats >= self.stats_interval:
+                    self.log_stats()
+                    last_stats = time.monotonic()
+                time.sleep(0.5)
+                continue
+            index = self._children.pop(pid, None)
+            if index is None:
+                continue
+            if self._stopping:
+                self.logger.bind(tag=TAG).info(f"工作进程 {index} (pid {pid}) 已退出")
+                continue
+            self.logger.bind(tag=TAG).error(f"工作进程 {index} (pid {pid}) 异常退出: {status}，重新启动")
+            time.sleep(1)
+            self._spawn(index, worker)
+        self.logger.bind(tag=TAG).info("所有工作进程已退出")
+
+    def _spawn(self, index, worker):
+        pid = os.fork()
+        if pid > 0:
+            self._children[pid] = index
+            self.logger.bind(tag=TAG).info(f"工作进程 {index} 已启动，pid {pid}")
+            return
+        # 工作进程：由主进程转发退出信号，Ctrl+C 只由主进程处理
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        code = 0
+        try:
+            self._limit_threads()
+            worker(index, self.instances)
+        except BaseException as e:
+            self.logger.bind(tag=TAG).error(f"工作进程 {index} 出错: {e}")
+            code = 1
+        finally:
+            # 不执行继承自主进程的退出清理
+            os._exit(code)
+
+    def _limit_threads(self):
+        """按工作进程数分摊CPU核，避免每个进程都按全部核数创建计算线程"""
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+        runtime = self.config.get("runtime", {})
+        if not runtime.get("cpu_workers"):
+            self.config["runtime"] = dict(runtime, cpu_workers=threads)
+
+    def _handle_signal(self, signum, frame):
+        if self._stopping:
+            return
+        self._stopping = True
+        self.logger.bind(tag=TAG).info("收到退出信号，停止工作进程")
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def stats(self):
+        workers = {}
+        for pid, index in sorted(self._children.items(), key=lambda item: item[1]):
+            memory = read_memory(pid)
+            workers[index] = {"pid": pid, **{key: round(value, 1) for key, value in memory.items()}}
+        return workers
+
+    def log_stats(self):
+        workers = self.stats()
+        total_pss = sum(worker["pss"] for worker in workers.values()) + read_memory(os.getpid())["pss"]
+        self.logger.bind(tag=TAG).info(
+            f"工作进程内存(MB): {json.dumps(workers, ensure_ascii=False)}，全部进程合计(PSS): {total_pss:.1f}MB"
+        )
@@ -3,12 +3,19 @@ import wave
 import os
 import sys
 import io
+import asyncio
 from abc import ABC, abstractmethod
 from config.logger import setup_logging
 from typing import Optional, Tuple, List
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+import multiprocessing
+import threading
 import uuid
+from collections import deque
 
-import opuslib_next
+import numpy as np
 from funasr import AutoModel
 from funasr.utils.postprocess_utils import rich_transcription_postprocess
 
@@ -33,24 +40,284 @@ class CaptureOutput:
 
 class ASR(ABC):
     @abstractmethod
-    def save_audio_to_file(self, opus_data: List[bytes], session_id: str) -> str:
-        """解码Opus数据并保存为WAV文件"""
+    def save_audio_to_file(self, pcm_data: bytes, session_id: str) -> str:
+        """将PCM数据保存为WAV文件"""
         pass
 
     @abstractmethod
-    def speech_to_text(self, opus_data: List[bytes], session_id: str) -> Tuple[Optional[str], Optional[str]]:
-        """将语音数据转换为文本"""
+    def speech_to_text(self, pcm_data: bytes, session_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """将16kHz单声道16位PCM语音数据转换为文本"""
         pass
 
+    def speech_to_text_batch(self, pcm_list: List[bytes], session_ids: List[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+        """批量识别多段语音，默认逐段调用 speech_to_text"""
+        return [self.speech_to_text(pcm_data, session_id) for pcm_data, session_id in zip(pcm_list, session_ids)]
+
+    async def speech_to_text_async(self, pcm_data: bytes, session_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """异步识别，默认在线程池中调用同步实现，不阻塞事件循环"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.speech_to_text, pcm_data, session_id)
+
+    async def speech_to_text_batch_async(self, pcm_list: List[bytes], session_ids: List[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+        """异步批量识别，默认在线程池中调用同步实现"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.speech_to_text_batch, pcm_list, session_ids)
+
+    def remove_audio_file(self, file_path: Optional[str]):
+        """配置了 delete_audio 时，识别完成后删除保存的音频文件"""
+        if not self.delete_audio_file or not file_path or not os.path.exists(file_path):
+            return
+        try:
+            os.remove(file_path)
+            logger.bind(tag=TAG).debug(f"已删除临时音频文件: {file_path}")
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"文件删除失败: {file_path} | 错误: {e}")
+
+    def create_stream(self) -> Optional["ASRStream"]:
+        """创建连接的流式识别状态，不支持流式识别的实现返回 None；
+        返回了流式状态的实现还需提供 stream_feed 和 stream_finish"""
+        return None
+
+
+class ASRStream:
+    """单个连接的流式识别状态：模型缓存、未凑够一个块的音频和已识别的文本"""
+
+    def __init__(self):
+        self.cache = {}
+        self.pending = bytearray()
+        self.text = ""
+        # 已提交、还没识别完的块，按提交顺序排列，每个块等前一个识别完再开始
+        self.tasks = deque()
+        # 每次重置加一，丢弃重置前提交、还没识别的块
+        self.generation = 0
+
+    def reset(self):
+        """丢弃当前这句话的状态，还没识别完的块一起取消，不会再下发部分结果"""
+        self.cache = {}
+        self.pending.clear()
+        self.text = ""
+        for task in self.tasks:
+            task.cancel()
+        self.tasks.clear()
+        self.generation += 1
+
+
+class ASRBatchScheduler:
+    """跨连接的ASR批量调度器
+
+    各连接说完一句话后把音频提交到同一个队列，调度器从第一段音频到达起最多等待
+    max_wait_ms，或凑满 max_batch_size 段，就把这一批交给模型做一次批量识别，
+    再把每段的识别结果返回给对应的连接。最多同时有 max_concurrency 批在识别
+    （对应ASR工作进程数），识别期间到达的音频会进入下一批。
+    """
+
+    def __init__(self, asr: ASR, max_batch_size=8, max_wait_ms=100, max_concurrency=1):
+        self.asr = asr
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+        # 统计信息
+        self.total_utterances = 0
+        self.total_batches = 0
+
+    async def submit(self, pcm_data: bytes, session_id: str) -> Tuple[Optional[str], Optional[str]]:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((pcm_data, session_id, future))
+        return await future
+
+    async def _collect(self):
+        """取出一批待识别的音频，批次大小和等待时间都有上限"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # 有空闲的识别槽位时才开始凑下一批，槽位都忙时音频继续在队列中累积
+            await self._slots.acquire()
+            batch = await self._collect()
+            asyncio.get_running_loop().create_task(self._process(batch))
+
+    async def _process(self, batch):
+        pcm_list = [item[0] for item in batch]
+        session_ids = [item[1] for item in batch]
+        try:
+            results = await self.asr.speech_to_text_batch_async(pcm_list, session_ids)
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"批量语音识别失败: {e}")
+            results = [(None, None)] * len(batch)
+        finally:
+            self._slots.release()
+        if len(results) != len(batch):
+            logger.bind(tag=TAG).error(f"批量语音识别结果数量不符: 输入 {len(batch)} 段，返回 {len(results)} 个结果")
+        # 每段都要给出结果，否则对应连接会一直停在等待识别的状态
+        for index, (_, _, future) in enumerate(batch):
+            if not future.done():
+                future.set_result(results[index] if index < len(results) else (None, None))
+        self.total_utterances += len(batch)
+        self.total_batches += 1
+
+
+def _init_asr_worker(class_name, config, delete_audio_file, torch_threads):
+    """ASR工作进程初始化：限制计算线程数并预加载模型"""
+    global _worker_asr
+    import torch
+    torch.set_num_threads(torch_threads)
+    worker_config = dict(config, process_workers=0, batch_enabled=False)
+    _worker_asr = create_instance(class_name, worker_config, delete_audio_file)
+
+
+def _worker_ready():
+    return os.getpid()
+
+
+def _worker_speech_to_text_batch(segments, session_ids):
+    """在工作进程中从共享内存读取音频并识别"""
+    pcm_list = []
+    for name, size in segments:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            # 共享内存由主进程负责释放，这里只读取
+            pcm_list.append(bytes(shm.buf[:size]))
+        finally:
+            shm.close()
+    return _worker_asr.speech_to_text_batch(pcm_list, session_ids)
+
+
+class ASRProcessPool:
+    """ASR工作进程池
+
+    每个工作进程启动时预加载一份模型，识别在独立进程中进行，不占用主进程的
+    事件循环和GIL。音频通过共享内存传给工作进程，避免经过进程间管道序列化。
+    有工作进程异常退出（如内存不足被杀）时进程池不可再用，这时重建进程池并重试一次。
+    """
+
+    def __init__(self, class_name, config, delete_audio_file, workers, torch_threads):
+        self.workers = workers
+        self._initargs = (class_name, config, delete_audio_file, torch_threads)
+        self._lock = threading.Lock()
+        self._executor = self._create_executor()
+        # 启动时让每个工作进程都完成模型加载，避免第一句话时才加载
+        pids = [future.result() for future in [self._executor.submit(_worker_ready) for _ in range(workers)]]
+        logger.bind(tag=TAG).info(f"ASR工作进程已就绪: {pids}")
+
+    def _create_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_asr_worker,
+            initargs=self._initargs,
+        )
+
+    def _restart(self, broken):
+        """重建已损坏的进程池，新进程在第一次识别时加载模型，这里不等待"""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            logger.bind(tag=TAG).error("ASR工作进程异常退出，重建进程池")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._create_executor()
+
+    def _submit(self, segments, session_ids):
+        executor = self._executor
+        try:
+            return executor, executor.submit(_worker_speech_to_text_batch, segments, session_ids)
+        except BrokenProcessPool:
+            self._restart(executor)
+            executor = self._executor
+            return executor, executor.submit(_worker_speech_to_text_batch, segments, session_ids)
+
+    @staticmethod
+    def _share(pcm_list):
+        """把音频写入共享内存，返回 (片段描述, 共享内存对象)"""
+        segments, shms = [], []
+        try:
+            for pcm_data in pcm_list:
+                size = len(pcm_data)
+                shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+                shms.append(shm)
+                shm.buf[:size] = pcm_data
+                segments.append((shm.name, size))
+        except BaseException:
+            ASRProcessPool._release(shms)
+            raise
+        return segments, shms
+
+    @staticmethod
+    def _release(shms):
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    def speech_to_text_batch(self, pcm_list: List[bytes], session_ids: List[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+        segments, shms = self._share(pcm_list)
+        try:
+            for _ in range(2):
+                executor, future = self._submit(segments, session_ids)
+                try:
+                    return future.result()
+                except BrokenProcessPool:
+                    self._restart(executor)
+            return [(None, None)] * len(pcm_list)
+        finally:
+            self._release(shms)
+
+    async def speech_to_text_batch_async(self, pcm_list: List[bytes], session_ids: List[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+        segments, shms = self._share(pcm_list)
+        try:
+            for _ in range(2):
+                executor, future = self._submit(segments, session_ids)
+                try:
+                    return await asyncio.wrap_future(future)
+                except BrokenProcessPool:
+                    self._restart(executor)
+            return [(None, None)] * len(pcm_list)
+        finally:
+            self._release(shms)
+
 
 class FunASR(ASR):
     def __init__(self, config: dict, delete_audio_file: bool):
         self.model_dir = config.get("model_dir")
         self.output_dir = config.get("output_dir")  # 修正配置键名
         self.delete_audio_file = delete_audio_file
+        # 调试用：把每段识别的音频另存为WAV文件，默认直接在内存中识别
+        self.save_audio = config.get("save_audio", False)
+
+        # 跨连接批量识别配置
+        self.batch_enabled = config.get("batch_enabled", True)
+        self.batch_max_size = config.get("batch_max_size", 8)
+        self.batch_max_wait_ms = config.get("batch_max_wait_ms", 100)
+        self.scheduler = None
+
+        # 多进程识别配置：0 表示在主进程的ASR工作线程中识别，auto 表示按CPU核数设置进程数
+        self.process_threads = config.get("process_threads", 2)
+        process_workers = config.get("process_workers", 0)
+        if process_workers == "auto":
+            process_workers = max(1, (os.cpu_count() or 1) // self.process_threads)
+        self.process_workers = int(process_workers)
+        self.process_pool = None
+        self._executor = None
 
         # 确保输出目录存在
         os.makedirs(self.output_dir, exist_ok=True)
+        if self.process_workers > 0:
+            # 模型只在工作进程中加载，主进程不再持有一份
+            self.model = None
+            self.process_pool = ASRProcessPool(
+                "FunASR", config, delete_audio_file, self.process_workers, self.process_threads
+            )
+            return
         with CaptureOutput():
             self.model = AutoModel(
                 model=self.model_dir,
@@ -60,73 +327,249 @@ class FunASR(ASR):
                 # device="cuda:0",  # 启用GPU加速
             )
 
-    def save_audio_to_file(self, opus_data: List[bytes], session_id: str) -> str:
-        """将Opus音频数据解码并保存为WAV文件"""
+    def write_wav(self, pcm_data: bytes, session_id: str) -> str:
+        """将PCM数据保存为WAV文件"""
         file_name = f"asr_{session_id}_{uuid.uuid4()}.wav"
         file_path = os.path.join(self.output_dir, file_name)
 
-        decoder = opuslib_next.Decoder(16000, 1)  # 16kHz, 单声道
-        pcm_data = []
-
-        for opus_packet in opus_data:
-            try:
-                pcm_frame = decoder.decode(opus_packet, 960)  # 960 samples = 60ms
-                pcm_data.append(pcm_frame)
-            except opuslib_next.OpusError as e:
-                logger.bind(tag=TAG).error(f"Opus解码错误: {e}", exc_info=True)
-
         with wave.open(file_path, "wb") as wf:
             wf.setnchannels(1)
             wf.setsampwidth(2)  # 2 bytes = 16-bit
             wf.setframerate(16000)
-            wf.writeframes(b"".join(pcm_data))
+            wf.writeframes(pcm_data)
 
         return file_path
 
-    def speech_to_text(self, opus_data: List[bytes], session_id: str) -> Tuple[Optional[str], Optional[str]]:
-        """语音转文本主处理逻辑"""
-        file_path = None
+    def save_audio_to_file(self, pcm_data: bytes, session_id: str) -> str:
+        """将PCM数据保存为WAV文件"""
+        return self.write_wav(pcm_data, session_id)
+
+    def speech_to_text(self, pcm_data: bytes, session_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """语音转文本主处理逻辑，pcm_data 为VAD阶段已解码的音频"""
+        return self.speech_to_text_batch([pcm_data], [session_id])[0]
+
+    def speech_to_text_batch(self, pcm_list: List[bytes], session_ids: List[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+        """多段语音一次送入模型批量识别"""
+        if self.process_pool is not None:
+            return self.process_pool.speech_to_text_batch(pcm_list, session_ids)
+        file_paths = [None] * len(pcm_list)
         try:
-            # 保存音频文件
-            start_time = time.time()
-            file_path = self.save_audio_to_file(opus_data, session_id)
-            logger.bind(tag=TAG).debug(f"音频文件保存耗时: {time.time() - start_time:.3f}s | 路径: {file_path}")
+            if self.save_audio:
+                file_paths = [self.write_wav(pcm_data, session_id) for pcm_data, session_id in zip(pcm_list, session_ids)]
+                logger.bind(tag=TAG).debug(f"音频文件已保存: {file_paths}")
+            # 直接把内存中的PCM交给模型，不经过磁盘
+            audios = [np.frombuffer(pcm_data, dtype=np.int16).astype(np.float32) / 32768.0 for pcm_data in pcm_list]
 
             # 语音识别
             start_time = time.time()
             result = self.model.generate(
-                input=file_path,
+                input=audios,
                 cache={},
                 language="auto",
                 use_itn=True,
-                batch_size_s=60,
+                batch_size=len(audios),
             )
-            text = rich_transcription_postprocess(result[0]["text"])
-            logger.bind(tag=TAG).debug(f"语音识别耗时: {time.time() - start_time:.3f}s | 结果: {text}")
+            texts = [rich_transcription_postprocess(item["text"]) for item in result]
+            logger.bind(tag=TAG).debug(f"语音识别耗时: {time.time() - start_time:.3f}s | 批大小: {len(audios)} | 结果: {texts}")
 
-            return text, file_path
+            return list(zip(texts, file_paths))
+
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"语音识别失败: {e}", exc_info=True)
+            return [(None, None)] * len(pcm_list)
+
+        finally:
+            for file_path in file_paths:
+                self.remove_audio_file(file_path)
+
+    async def speech_to_text_batch_async(self, pcm_list: List[bytes], session_ids: List[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+        if self.process_pool is not None:
+            return await self.process_pool.speech_to_text_batch_async(pcm_list, session_ids)
+        if self._executor is None:
+            # 同一个模型实例只在一个ASR工作线程中串行推理
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="asr-worker")
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self.speech_to_text_batch, pcm_list, session_ids
+        )
+
+    async def speech_to_text_async(self, pcm_data: bytes, session_id: str) -> Tuple[Optional[str], Optional[str]]:
+        if not self.batch_enabled:
+            return (await self.speech_to_text_batch_async([pcm_data], [session_id]))[0]
+        if self.scheduler is None:
+            self.scheduler = ASRBatchScheduler(
+                self, self.batch_max_size, self.batch_max_wait_ms, max(1, self.process_workers)
+            )
+        return await self.scheduler.submit(pcm_data, session_id)
+
+
+class FunASRStreaming(ASR):
+    """流式识别：说话过程中按块识别，说完后只需识别最后不足一块的音频"""
+
+    def __init__(self, config: dict, delete_audio_file: bool):
+        self.model_dir = config.get("model_dir")
+        self.output_dir = config.get("output_dir")
+        self.delete_audio_file = delete_audio_file
+        self.save_audio = config.get("save_audio", False)
+        # [0, 10, 5] 表示每块600ms（10 x 60ms），向后看300ms
+        self.chunk_size = config.get("chunk_size", [0, 10, 5])
+        self.encoder_chunk_look_back = config.get("encoder_chunk_look_back", 4)
+        self.decoder_chunk_look_back = config.get("decoder_chunk_look_back", 1)
+        # 每块的字节数：每个60ms单位960个采样点，每个采样点2字节
+        self.chunk_bytes = self.chunk_size[1] * 960 * 2
+        # 同一个模型实例只在一个识别线程中串行推理
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="asr-stream")
+
+        if not os.path.isdir(self.model_dir):
+            raise FileNotFoundError(
+                f"流式识别模型目录不存在: {self.model_dir}，请先下载 paraformer-zh-streaming 模型，例如 "
+                f"huggingface-cli download funasr/paraformer-zh-streaming --local-dir {self.model_dir}"
+            )
+        os.makedirs(self.output_dir, exist_ok=True)
+        with CaptureOutput():
+            self.model = AutoModel(
+                model=self.model_dir,
+                disable_update=True,
+                hub="hf"
+            )
+
+    def save_audio_to_file(self, pcm_data: bytes, session_id: str) -> str:
+        """将PCM数据保存为WAV文件"""
+        file_path = os.path.join(self.output_dir, f"asr_{session_id}_{uuid.uuid4()}.wav")
+        with wave.open(file_path, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(16000)
+            wf.writeframes(pcm_data)
+        return file_path
+
+    def _generate(self, cache: dict, chunk: bytes, is_final: bool) -> str:
+        audio = np.frombuffer(chunk, dtype=np.int16).astype(np.float32) / 32768.0
+        result = self.model.generate(
+            input=audio,
+            cache=cache,
+            is_final=is_final,
+            chunk_size=self.chunk_size,
+            encoder_chunk_look_back=self.encoder_chunk_look_back,
+            decoder_chunk_look_back=self.decoder_chunk_look_back,
+        )
+        return result[0]["text"] if result else ""
 
+    def speech_to_text(self, pcm_data: bytes, session_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """整段识别：按块依次送入模型"""
+        file_path = None
+        try:
+            file_path = self.save_audio_to_file(pcm_data, session_id) if self.save_audio else None
+            cache = {}
+            text = ""
+            data = bytes(pcm_data)
+            for offset in range(0, max(len(data), 1), self.chunk_bytes):
+                chunk = data[offset:offset + self.chunk_bytes]
+                text += self._generate(cache, chunk, offset + self.chunk_bytes >= len(data))
+            return text, file_path
         except Exception as e:
             logger.bind(tag=TAG).error(f"语音识别失败: {e}", exc_info=True)
             return None, None
 
         finally:
-            # 文件清理逻辑
-            if self.delete_audio_file and file_path and os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    logger.bind(tag=TAG).debug(f"已删除临时音频文件: {file_path}")
-                except Exception as e:
-                    logger.bind(tag=TAG).error(f"文件删除失败: {file_path} | 错误: {e}")
+            self.remove_audio_file(file_path)
+
+    def create_stream(self) -> ASRStream:
+        return ASRStream()
+
+    def stream_feed(self, stream: ASRStream, pcm_frame: bytes, on_partial=None):
+        """说话过程中送入一帧PCM，凑够一个块就在后台识别，on_partial 接收当前的部分结果"""
+        stream.pending.extend(pcm_frame)
+        while stream.tasks and stream.tasks[0].done():
+            stream.tasks.popleft()
+        while len(stream.pending) >= self.chunk_bytes:
+            chunk = bytes(stream.pending[:self.chunk_bytes])
+            del stream.pending[:self.chunk_bytes]
+            previous = stream.tasks[-1] if stream.tasks else None
+            stream.tasks.append(asyncio.get_running_loop().create_task(
+                self._decode_chunk(stream, stream.generation, chunk, False, on_partial, previous)
+            ))
+
+    async def _decode_chunk(self, stream: ASRStream, generation: int, chunk: bytes, is_final: bool,
+                            on_partial=None, previous=None):
+        if previous is not None:
+            # 等前一个块识别完，模型缓存按块的顺序更新
+            await asyncio.wait([previous])
+        if generation != stream.generation:
+            return
+        try:
+            text = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._generate, stream.cache, chunk, is_final
+            )
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"流式识别失败: {e}", exc_info=True)
+            return
+        if generation != stream.generation or not text:
+            return
+        stream.text += text
+        if on_partial is not None and not is_final:
+            await on_partial(stream.text)
+
+    async def stream_finish(self, stream: ASRStream, pcm_data: bytes, session_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """说话结束，等之前提交的块按顺序识别完，再识别剩余的音频，返回整句结果"""
+        start_time = time.time()
+        chunk = bytes(stream.pending)
+        stream.pending.clear()
+        if stream.tasks:
+            await asyncio.wait(list(stream.tasks))
+        await self._decode_chunk(stream, stream.generation, chunk, True)
+        text = stream.text
+        stream.reset()
+        logger.bind(tag=TAG).debug(f"流式识别收尾耗时: {time.time() - start_time:.3f}s | 结果: {text}")
+        file_path = None
+        if self.save_audio:
+            file_path = self.save_audio_to_file(pcm_data, session_id)
+            self.remove_audio_file(file_path)
+        return text, file_path
+
+    async def speech_to_text_async(self, pcm_data: bytes, session_id: str) -> Tuple[Optional[str], Optional[str]]:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self.speech_to_text, pcm_data, session_id
+        )
 
 
 def create_instance(class_name: str, *args, **kwargs) -> ASR:
     """工厂方法创建ASR实例"""
     cls_map = {
         "FunASR": FunASR,
+        "FunASRStreaming": FunASRStreaming,
         # 可扩展其他ASR实现
     }
 
     if cls := cls_map.get(class_name):
         return cls(*args, **kwargs)
     raise ValueError(f"不支持的ASR类型: {class_name}")
+
+
+if __name__ == "__main__":
+    """
+      吞吐测试：逐段识别 vs 批量识别
+    """
+    from pydub import AudioSegment
+    from core.utils.util import read_config, get_project_dir
+
+    config = read_config(get_project_dir() + "config.yaml")
+    asr = create_instance(
+        config["selected_module"]["ASR"],
+        config["ASR"][config["selected_module"]["ASR"]],
+        config["delete_audio"]
+    )
+    example = os.path.join(asr.model_dir, "example", "zh.mp3")
+    pcm = AudioSegment.from_file(example).set_channels(1).set_frame_rate(16000).set_sample_width(2).raw_data
+    num_utterances = 32
+
+    start = time.time()
+    for i in range(num_utterances):
+        asr.speech_to_text(pcm, f"bench-{i}")
+    serial = num_utterances / (time.time() - start)
+
+    for batch_size in (4, 8, 16):
+        start = time.time()
+        for i in range(0, num_utterances, batch_size):
+            asr.speech_to_text_batch([pcm] * batch_size, [f"bench-{i + j}" for j in range(batch_size)])
+        batched = num_utterances / (time.time() - start)
+        print(f"批大小 {batch_size:2d}: 逐段 {serial:.2f} 段/秒, 批量 {batched:.2f} 段/秒, 加速 {batched / serial:.1f}x")
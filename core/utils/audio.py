@@ -0,0 +1,376 @@
+import asyncio
+import os
+import queue
+import struct
+import wave
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+import opuslib_next
+from pydub import AudioSegment
+
+# 设备端使用的音频格式：16kHz单声道，每个Opus包60ms
+OPUS_SAMPLE_RATE = 16000
+OPUS_FRAME_MS = 60
+
+
+def downmix(samples, channels):
+    """多声道int16交错采样取平均，合成单声道"""
+    if channels == 1:
+        return samples
+    usable = len(samples) - len(samples) % channels
+    # 按声道做步长切片相加，比沿 axis=1 归约快得多
+    mixed = samples[0:usable:channels].astype(np.int32)
+    for channel in range(1, channels):
+        mixed += samples[channel:usable:channels]
+    mixed //= channels
+    return mixed.astype(np.int16)
+
+
+def read_wav(file_path, sample_rate=OPUS_SAMPLE_RATE):
+    """直接解析16位PCM编码的WAV，转成单声道并重采样
+
+    按RIFF块读取，支持 WAVE_FORMAT_EXTENSIBLE 和流式接口返回的长度未知（0xFFFFFFFF）的文件头。
+    返回int16采样点；不是16位PCM的WAV（如浮点、压缩编码或其他格式的文件）返回 None，
+    由调用方改用ffmpeg解码。
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        size, = struct.unpack_from("<I", data, offset + 4)
+        body = offset + 8
+        if chunk_id == b"fmt " and size >= 16:
+            tag, channels, rate, _, _, bits = struct.unpack_from("<HHIIHH", data, body)
+            if tag == 0xFFFE and size >= 26:
+                # 扩展格式的实际编码在子格式GUID的前两个字节
+                tag, = struct.unpack_from("<H", data, body + 24)
+            fmt = (tag, channels, rate, bits)
+        elif chunk_id == b"data":
+            if fmt is None or fmt[0] != 1 or fmt[3] != 16:
+                return None
+            _, channels, rate, _ = fmt
+            end = min(body + size, len(data))
+            end -= (end - body) % (2 * channels)
+            samples = np.frombuffer(data, dtype=np.int16, count=(end - body) // 2, offset=body)
+            return to_mono_rate(samples, rate, channels, sample_rate)
+        # RIFF块按偶数字节对齐
+        offset = body + size + (size & 1)
+    return None
+
+
+def read_pcm(file_path, rate, channels=1, sample_rate=OPUS_SAMPLE_RATE):
+    """读取没有文件头的16位小端PCM文件"""
+    with open(file_path, "rb") as f:
+        data = f.read()
+    usable = len(data) - len(data) % (2 * channels)
+    return to_mono_rate(np.frombuffer(data, dtype=np.int16, count=usable // 2), rate, channels, sample_rate)
+
+
+def to_mono_rate(samples, rate, channels, sample_rate=OPUS_SAMPLE_RATE):
+    """把int16采样点转成单声道并重采样到 sample_rate"""
+    samples = downmix(samples, channels)
+    if rate != sample_rate:
+        resampler = PolyphaseResampler(rate, sample_rate)
+        samples = np.concatenate((resampler.process(samples), resampler.flush()))
+    return samples
+
+
+def decode_with_ffmpeg(file_path, sample_rate=OPUS_SAMPLE_RATE):
+    """通过pydub调用ffmpeg解码任意格式的音频文件，返回单声道int16采样点"""
+    file_type = os.path.splitext(file_path)[1].lstrip(".") or None
+    audio = AudioSegment.from_file(file_path, format=file_type)
+    audio = audio.set_channels(1).set_frame_rate(sample_rate).set_sample_width(2)
+    return np.frombuffer(audio.raw_data, dtype=np.int16)
+
+
+def pcm_to_opus(samples, sample_rate=OPUS_SAMPLE_RATE):
+    """把完整的一段PCM编码为Opus包，返回 (包列表, 时长秒)"""
+    encoder = OpusStreamEncoder(sample_rate)
+    packets = encoder.encode(samples)
+    packets.extend(encoder.flush())
+    return packets, encoder.duration
+
+
+class PolyphaseResampler:
+    """可分块调用的多相FIR重采样器
+
+    按 up/down 的有理数比例重采样，滤波器按相位拆开后只计算实际输出的采样点，
+    块与块之间保留滤波器长度的历史数据，分块处理与一次性处理的结果一致。
+    """
+
+    def __init__(self, src_rate, dst_rate, zero_crossings=8):
+        g = gcd(src_rate, dst_rate)
+        self.up = dst_rate // g
+        self.down = src_rate // g
+        self._phases, center = self._design(self.up, self.down, zero_crossings)
+        self.taps = self._phases.shape[1]
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._in_total = 0
+        self._next_out = 0
+        self._out_total = 0
+        # 补偿滤波器的群延迟，输出与输入对齐
+        self._skip = center // self.down
+
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def _design(up, down, zero_crossings):
+        """设计低通滤波器并按相位拆分，相同的采样率组合只计算一次"""
+        # 降采样时滤波器按比例加长，保证截止频率两侧都有足够的过零点
+        taps_per_phase = -(-2 * zero_crossings * max(up, down) // up)
+        length = taps_per_phase * up
+        # 截止频率取两个采样率中较低的奈奎斯特频率，Kaiser窗加窗的sinc低通
+        cutoff = 1.0 / max(up, down)
+        # 滤波器中心取 down 的整数倍，群延迟正好是整数个输出采样点
+        center = round((length - 1) / 2.0 / down) * down
+        n = np.arange(length) - center
+        h = cutoff * np.sinc(cutoff * n) * np.kaiser(length, 8.0) * up
+        # 第p相的系数 h[k * up + p]，倒序后与输入窗口直接做点积
+        phases = np.ascontiguousarray(h.reshape(taps_per_phase, up).T[:, ::-1], dtype=np.float32)
+        phases.flags.writeable = False
+        return phases, center
+
+    def _process(self, block):
+        buf = np.concatenate((self._history, block))
+        base = self._in_total - (self.taps - 1)
+        self._in_total += len(block)
+        if self._in_total == 0:
+            return np.zeros(0, dtype=np.float32)
+        last = self._in_total - 1
+        end = (last * self.up + self.up - 1) // self.down + 1
+        first = self._next_out
+        count = max(0, end - first)
+        self._next_out = max(end, first)
+        self._history = buf[len(buf) - (self.taps - 1):]
+        out = np.empty(count, dtype=np.float32)
+        windows = np.lib.stride_tricks.sliding_window_view(buf, self.taps)
+        # 相位以 up 个输出为周期，同一相位的输出对应的输入窗口间隔 down 个采样点，
+        # 可以直接用步长切片取出，再与该相位的系数做矩阵向量乘
+        for q in range(min(self.up, count)):
+            pos = (first + q) * self.down
+            start = pos // self.up - base - (self.taps - 1)
+            n = (count - q + self.up - 1) // self.up
+            out[q::self.up] = windows[start:start + self.down * (n - 1) + 1:self.down] @ self._phases[pos % self.up]
+        if self._skip:
+            drop = min(self._skip, len(out))
+            out = out[drop:]
+            self._skip -= drop
+        return out
+
+    @staticmethod
+    def _to_int16(out):
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+
+    def process(self, samples):
+        """输入int16采样点，返回已经可以确定的int16输出"""
+        if self.up == self.down:
+            return samples
+        out = self._process(samples.astype(np.float32))
+        self._out_total += len(out)
+        return self._to_int16(out)
+
+    def flush(self):
+        """输入结束，输出滤波器中剩余的采样点"""
+        if self.up == self.down:
+            return np.zeros(0, dtype=np.int16)
+        expected = -(-self._in_total * self.up // self.down)
+        in_total = self._in_total
+        out = self._process(np.zeros(self.taps, dtype=np.float32))
+        self._in_total = in_total
+        out = out[:max(0, expected - self._out_total)]
+        self._out_total += len(out)
+        return self._to_int16(out)
+
+
+class OpusStreamEncoder:
+    """增量Opus编码器，不足一帧的数据留到下次，结束时补零编码最后一帧"""
+
+    def __init__(self, sample_rate=OPUS_SAMPLE_RATE, frame_ms=OPUS_FRAME_MS):
+        self.sample_rate = sample_rate
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.encoder = opuslib_next.Encoder(sample_rate, 1, opuslib_next.APPLICATION_AUDIO)
+        self._pending = bytearray()
+        self.samples = 0
+
+    @property
+    def duration(self):
+        """已送入音频的时长（秒）"""
+        return self.samples / self.sample_rate
+
+    def encode(self, pcm):
+        """送入16位单声道PCM，返回已经凑满的Opus包"""
+        pcm = pcm.tobytes() if isinstance(pcm, np.ndarray) else pcm
+        self.samples += len(pcm) // 2
+        self._pending.extend(pcm)
+        frame_bytes = self.frame_size * 2
+        packets = []
+        offset = 0
+        while len(self._pending) - offset >= frame_bytes:
+            packets.append(self.encoder.encode(bytes(self._pending[offset:offset + frame_bytes]), self.frame_size))
+            offset += frame_bytes
+        del self._pending[:offset]
+        return packets
+
+    def flush(self):
+        if not self._pending:
+            return []
+        frame_bytes = self.frame_size * 2
+        chunk = bytes(self._pending) + b"\x00" * (frame_bytes - len(self._pending))
+        self._pending.clear()
+        return [self.encoder.encode(chunk, self.frame_size)]
+
+
+class FFmpegStreamDecoder:
+    """通过ffmpeg管道把mp3等压缩音频边收边解码为16kHz单声道PCM"""
+
+    def __init__(self, input_format, sample_rate=OPUS_SAMPLE_RATE):
+        self.input_format = input_format
+        self.sample_rate = sample_rate
+        self.process = None
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            AudioSegment.converter, "-loglevel", "error",
+            "-f", self.input_format, "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-ar", str(self.sample_rate), "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+
+    async def write(self, data):
+        self.process.stdin.write(data)
+        await self.process.stdin.drain()
+
+    async def close_input(self):
+        self.process.stdin.close()
+
+    async def read(self, size=OPUS_SAMPLE_RATE * OPUS_FRAME_MS // 1000 * 2):
+        """逐块读取解码后的PCM，直到ffmpeg输出结束"""
+        while True:
+            data = await self.process.stdout.read(size)
+            if not data:
+                break
+            yield data
+        await self.process.wait()
+
+    def kill(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+
+
+class OpusPacketStream:
+    """合成线程与发送线程之间传递Opus包的队列，合成过程中就可以开始发送"""
+
+    def __init__(self, sample_rate=OPUS_SAMPLE_RATE, frame_ms=OPUS_FRAME_MS):
+        self.packet_duration = frame_ms / 1000
+        self._queue = queue.Queue()
+        self.cancelled = False
+        self.error = None
+        # 已产生的全部Opus包，合成完成后可写入TTS缓存
+        self.packets = []
+        self.closed = False
+        # 在事件循环中读取时，合成线程通过该事件唤醒读取方
+        self._loop = None
+        self._event = None
+
+    @property
+    def duration(self):
+        return len(self.packets) * self.packet_duration
+
+    def put(self, packets):
+        if packets:
+            self.packets.extend(packets)
+            self._queue.put(packets)
+            self._notify()
+
+    def close(self, error=None):
+        if self.closed:
+            return
+        self.error = error
+        self.closed = True
+        self._queue.put(None)
+        self._notify()
+
+    def _notify(self):
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._event.set)
+
+    def cancel(self):
+        self.cancelled = True
+        self._notify()
+
+    def chunks(self, timeout=10):
+        """按到达顺序返回Opus包列表，合成结束后停止；超时抛出 queue.Empty"""
+        while True:
+            packets = self._queue.get(timeout=timeout)
+            if packets is None:
+                return
+            yield packets
+
+    async def achunks(self, timeout=10):
+        """在事件循环中按到达顺序返回Opus包列表，合成结束后停止；超时抛出 asyncio.TimeoutError"""
+        self._event = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        sent = 0
+        while True:
+            # 先清除再检查，检查之后到达的包一定会重新唤醒
+            self._event.clear()
+            count = len(self.packets)
+            if count > sent:
+                yield self.packets[sent:count]
+                sent = count
+                continue
+            if self.closed or self.cancelled:
+                return
+            await asyncio.wait_for(self._event.wait(), timeout)
+
+
+if __name__ == "__main__":
+    """
+      WAV转Opus耗时测试：pydub vs 原生WAV解码
+    """
+    import tempfile
+    import time
+
+    def write_test_wav(file_path, rate, channels, extensible, seconds=3):
+        t = np.arange(rate * seconds) / rate
+        tone = (8000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+        data = np.repeat(tone, channels).tobytes()
+        if not extensible:
+            with wave.open(file_path, "wb") as wf:
+                wf.setnchannels(channels)
+                wf.setsampwidth(2)
+                wf.setframerate(rate)
+                wf.writeframes(data)
+            return
+        # WAVE_FORMAT_EXTENSIBLE 文件头，pydub无法直接读取，会调用ffprobe/ffmpeg
+        fmt = struct.pack("<HHIIHH", 0xFFFE, channels, rate, rate * channels * 2, channels * 2, 16)
+        fmt += struct.pack("<HHI", 22, 16, 0) + b"\x01\x00\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71"
+        body = b"WAVEfmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", len(data)) + data
+        with open(file_path, "wb") as f:
+            f.write(b"RIFF" + struct.pack("<I", len(body)) + body)
+
+    cases = [(16000, 1, False), (24000, 1, False), (44100, 2, False), (24000, 1, True)]
+    rounds = 20
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for rate, channels, extensible in cases:
+            file_path = os.path.join(tmp_dir, f"test_{rate}_{channels}_{int(extensible)}.wav")
+            write_test_wav(file_path, rate, channels, extensible)
+            costs = {}
+            for name, decode in (("pydub", decode_with_ffmpeg), ("原生WAV", read_wav)):
+                try:
+                    start = time.perf_counter()
+                    for _ in range(rounds):
+                        pcm_to_opus(decode(file_path))
+                    costs[name] = f"{(time.perf_counter() - start) / rounds * 1000:6.1f}ms"
+                except Exception as e:
+                    costs[name] = f"失败({type(e).__name__})"
+            header = "扩展文件头" if extensible else "标准文件头"
+            print(f"{rate}Hz {channels}声道 {header}: pydub {costs['pydub']}, 原生WAV {costs['原生WAV']}")
@@ -0,0 +1,145 @@
+import numpy as np
+
+
+class PCMRingBuffer:
+    """预分配的16位PCM环形缓冲区
+
+    写入时只拷贝新到达的采样点，读取时返回缓冲区上的numpy视图，
+    避免 bytes 拼接/切片带来的整段拷贝。返回的视图在下一次写入前有效，
+    调用方需要在此之前用完或自行转换。
+    """
+
+    def __init__(self, capacity=16000):
+        self.capacity = capacity
+        self._buf = np.zeros(capacity, dtype=np.int16)
+        # 读取跨越缓冲区末尾时，拼接到这块预分配的空间中
+        self._scratch = np.zeros(capacity, dtype=np.int16)
+        self._read = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def write(self, pcm):
+        """写入PCM数据（bytes或int16数组），缓冲区满时丢弃最旧的数据"""
+        samples = np.frombuffer(pcm, dtype=np.int16) if not isinstance(pcm, np.ndarray) else pcm
+        n = len(samples)
+        if n >= self.capacity:
+            samples = samples[-self.capacity:]
+            n = self.capacity
+            self._read = 0
+            self._size = 0
+        overflow = self._size + n - self.capacity
+        if overflow > 0:
+            self._read = (self._read + overflow) % self.capacity
+            self._size -= overflow
+
+        start = (self._read + self._size) % self.capacity
+        first = min(n, self.capacity - start)
+        self._buf[start:start + first] = samples[:first]
+        if first < n:
+            self._buf[:n - first] = samples[first:]
+        self._size += n
+
+    def read(self, n):
+        """读取并消费n个采样点，返回int16视图"""
+        if n > self._size:
+            raise ValueError(f"缓冲区数据不足: {self._size} < {n}")
+        start = self._read
+        end = start + n
+        if end <= self.capacity:
+            view = self._buf[start:end]
+        else:
+            first = self.capacity - start
+            view = self._scratch[:n]
+            view[:first] = self._buf[start:]
+            view[first:] = self._buf[:n - first]
+        self._read = end % self.capacity
+        self._size -= n
+        return view
+
+    def clear(self):
+        self._read = 0
+        self._size = 0
+
+
+class PCMSegmentBuffer:
+    """只追加的PCM分段缓冲区，保存一段话已解码的完整音频
+
+    预分配空间，不够时按倍数扩容；clear 只重置长度、保留已分配的空间，
+    同一连接的后续语句直接复用。view 返回内容的 memoryview，不产生拷贝。
+    """
+
+    def __init__(self, initial_bytes=16000 * 2 * 10):
+        self._buf = bytearray(initial_bytes)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, pcm):
+        n = len(pcm)
+        end = self._size + n
+        if end > len(self._buf):
+            grown = bytearray(max(len(self._buf) * 2, end))
+            grown[:self._size] = memoryview(self._buf)[:self._size]
+            self._buf = grown
+        self._buf[self._size:end] = pcm
+        self._size = end
+
+    def view(self):
+        return memoryview(self._buf)[:self._size]
+
+    def clear(self):
+        self._size = 0
+
+
+if __name__ == "__main__":
+    """
+      内存分配测试：bytes拼接切片 vs 环形缓冲区
+    """
+    import time
+    import tracemalloc
+
+    window = 512
+    frames = [np.random.randint(-3000, 3000, 960, dtype=np.int16).tobytes() for _ in range(2000)]
+
+    def bytes_path():
+        buffer = bytes()
+        for frame in frames:
+            buffer += frame
+            while len(buffer) >= window * 2:
+                chunk = buffer[:window * 2]
+                buffer = buffer[window * 2:]
+                yield np.frombuffer(chunk, dtype=np.int16).astype(np.float32) / 32768.0
+
+    def ring_path():
+        buffer = PCMRingBuffer()
+        for frame in frames:
+            buffer.write(frame)
+            while len(buffer) >= window:
+                window_data = buffer.read(window).astype(np.float32)
+                window_data *= 1.0 / 32768.0
+                yield window_data
+
+    for name, path in (("bytes拼接", bytes_path), ("环形缓冲区", ring_path)):
+        # 统计产生每个窗口时的内存分配峰值（不含模型输入本身的float32窗口）
+        tracemalloc.start()
+        allocated = 0
+        windows = 0
+        it = path()
+        while True:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            window_data = next(it, None)
+            if window_data is None:
+                break
+            allocated += tracemalloc.get_traced_memory()[1] - before - window_data.nbytes
+            windows += 1
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        for _ in path():
+            pass
+        cost = (time.perf_counter() - start) / len(frames) * 1e6
+        print(f"{name}: 每帧额外分配 {allocated / len(frames):7.0f} 字节, 每帧耗时 {cost:5.1f} 微秒")
@@ -1,6 +1,34 @@
+import re
+import time
 import uuid
 from typing import List, Dict
 from datetime import datetime
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+# 中日韩文字和全角符号大约每字一个token，其他文字大约每4个字符一个token
+_WIDE_CHARS = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+# 每条消息的角色和格式开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = "请把下面的对话整理成不超过{max_chars}字的摘要，保留用户的称呼、偏好和提到的重要事实，只输出摘要本身。"
+SUMMARY_TITLE = "之前的对话摘要："
+ROLE_NAMES = {"user": "用户", "assistant": "助手"}
+# 摘要生成失败后的重试间隔(秒)，连续失败时加倍，不超过上限
+SUMMARY_RETRY_SECONDS = 5
+SUMMARY_RETRY_MAX_SECONDS = 300
+# 等待摘要的消息最多保留 max_tokens 的几倍，摘要持续失败时丢弃最早的消息
+FOLDED_MAX_BUDGETS = 4
+
+
+def estimate_tokens(text):
+    """估算文本的token数，不依赖具体模型的分词器"""
+    if not text:
+        return 0
+    wide = len(_WIDE_CHARS.findall(text))
+    return wide + (len(text) - wide + 3) // 4
 
 
 class Message:
@@ -8,19 +36,166 @@ class Message:
         self.uniq_id = uniq_id if uniq_id is not None else str(uuid.uuid4())
         self.role = role
         self.content = content
+        self.tokens = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
 
 
 class Dialogue:
-    def __init__(self):
+    """对话历史
+
+    max_tokens 大于0时，发给LLM的对话（系统提示词、摘要和最近的消息）控制在预算之内：
+    超出时最早的几轮对话移出窗口，由 summarize 在后台合并成摘要附在系统提示词后面，
+    下一轮请求不等待摘要完成。系统提示词和最近 keep_messages 条消息始终保留。
+    """
+
+    def __init__(self, max_tokens=0, keep_messages=4, summary_max_chars=200):
         self.dialogue: List[Message] = []
+        self.max_tokens = max_tokens
+        self.keep_messages = keep_messages
+        self.summary_max_chars = summary_max_chars
+        self.summary = None
+        # 已移出窗口、还没有合并进摘要的消息
+        self.folded: List[Message] = []
+        # 摘要连续失败的次数和下一次可以重试的时间
+        self.summary_failures = 0
+        self._summary_retry_at = 0.0
+        # 窗口中的消息和摘要合计的token数，随消息增减更新
+        self.tokens = 0
         # 获取当前时间
         self.current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get("max_tokens", 0), config.get("keep_messages", 4), config.get("summary_max_chars", 200))
+
     def put(self, message: Message):
         self.dialogue.append(message)
+        self.tokens += message.tokens
 
     def get_llm_dialogue(self) -> List[Dict[str, str]]:
         dialogue = []
         for m in self.dialogue:
             dialogue.append({"role": m.role, "content": m.content})
+        if self.summary and dialogue and dialogue[0]["role"] == "system":
+            dialogue[0]["content"] = f"{dialogue[0]['content']}\n\n{SUMMARY_TITLE}{self.summary}"
         return dialogue
+
+    def fold(self, summarize=True):
+        """超出预算时把最早的对话移出窗口，返回是否有消息移出；summarize 为 False 时移出的消息直接丢弃"""
+        if self.max_tokens <= 0:
+            return False
+        # 系统提示词固定保留
+        start = 1 if self.dialogue and self.dialogue[0].role == "system" else 0
+        folded = []
+        while self.tokens > self.max_tokens and len(self.dialogue) - start > self.keep_messages:
+            folded.append(self._pop(start))
+        # 按整轮移出，窗口不以助手的回复开头
+        while folded and len(self.dialogue) - start > self.keep_messages and self.dialogue[start].role != "user":
+            folded.append(self._pop(start))
+        if summarize:
+            self.folded.extend(folded)
+            self._trim_folded()
+        return len(folded) > 0
+
+    async def summarize(self, llm, session_id):
+        """把移出窗口的消息合并进摘要，在后台执行，同一时间只运行一个
+
+        失败时消息放回 folded，退避时间过后在下一次有消息移出时重试；积压的消息有上限，超出时丢弃最早的
+        """
+        if time.monotonic() < self._summary_retry_at:
+            return
+        while self.folded:
+            # 每次最多合并 max_tokens 的消息，积压很多时分几次合并，摘要请求不会超出模型的上下文
+            count, tokens = 0, 0
+            while count < len(self.folded) and (count == 0 or tokens + self.folded[count].tokens <= self.max_tokens):
+                tokens += self.folded[count].tokens
+                count += 1
+            messages, self.folded = self.folded[:count], self.folded[count:]
+            lines = [f"{ROLE_NAMES.get(m.role, m.role)}：{m.content}" for m in messages]
+            if self.summary:
+                lines.insert(0, f"{SUMMARY_TITLE}{self.summary}")
+            prompt = [
+                {"role": "system", "content": SUMMARY_PROMPT.format(max_chars=self.summary_max_chars)},
+                {"role": "user", "content": "\n".join(lines)},
+            ]
+            start = time.perf_counter()
+            try:
+                summary = "".join([content async for content in llm.response_async(f"{session_id}-summary", prompt)]).strip()
+            except Exception as e:
+                self._summary_failed(messages, e)
+                return
+            # 供应商出错时返回【...】提示，不作为摘要
+            if not summary or summary.startswith("【"):
+                self._summary_failed(messages, summary)
+                return
+            self.summary_failures = 0
+            self._set_summary(summary[:self.summary_max_chars * 2])
+            logger.bind(tag=TAG).info(
+                f"对话摘要已更新: 合并{len(messages)}条消息，耗时 {(time.perf_counter() - start) * 1000:.0f}ms，"
+                f"当前窗口 {len(self.dialogue)} 条 / {self.tokens} tokens"
+            )
+
+    def _summary_failed(self, messages, reason):
+        # 放回最前面，之后移出的消息排在后面，重试时按原来的顺序合并
+        self.folded[:0] = messages
+        self._trim_folded()
+        self.summary_failures += 1
+        delay = min(SUMMARY_RETRY_SECONDS * 2 ** (self.summary_failures - 1), SUMMARY_RETRY_MAX_SECONDS)
+        self._summary_retry_at = time.monotonic() + delay
+        logger.bind(tag=TAG).error(
+            f"对话摘要生成失败: {reason}，{len(self.folded)}条消息等待重试，{delay}s 后可重试"
+        )
+
+    def _trim_folded(self):
+        limit = self.max_tokens * FOLDED_MAX_BUDGETS
+        tokens = sum(m.tokens for m in self.folded)
+        dropped = 0
+        while self.folded and tokens > limit:
+            tokens -= self.folded.pop(0).tokens
+            dropped += 1
+        if dropped:
+            logger.bind(tag=TAG).warning(f"等待摘要的消息超过 {limit} tokens，丢弃最早的 {dropped} 条")
+
+    def _pop(self, index):
+        message = self.dialogue.pop(index)
+        self.tokens -= message.tokens
+        return message
+
+    def _set_summary(self, summary):
+        self.tokens += estimate_tokens(summary) - estimate_tokens(self.summary)
+        self.summary = summary
+
+
+if __name__ == "__main__":
+    """
+      长对话测试：连续对话多轮，比较不限制和限制token预算时每轮请求的大小和构造耗时
+    """
+    import asyncio
+
+    class EchoLLM:
+        """模拟摘要：取每条消息的前几个字"""
+
+        async def response_async(self, session_id, dialogue, headers=None):
+            yield "；".join(line[:8] for line in dialogue[-1]["content"].split("\n"))
+
+    async def main():
+        llm = EchoLLM()
+        user_text = "今天天气怎么样，我下午想去公园散步，顺便买点水果回来。"
+        reply_text = "今天晴转多云，气温二十度左右，很适合散步。记得带上水，公园门口就有水果店。"
+        for max_tokens in (0, 1000):
+            dialogue = Dialogue(max_tokens=max_tokens)
+            dialogue.put(Message("system", "你是小智，一个友好的语音助手。" * 10))
+            task = None
+            for turn in range(1, 501):
+                dialogue.put(Message("user", user_text))
+                start = time.perf_counter()
+                if dialogue.fold() and (task is None or task.done()):
+                    task = asyncio.create_task(dialogue.summarize(llm, "test"))
+                request = dialogue.get_llm_dialogue()
+                build_us = (time.perf_counter() - start) * 1e6
+                dialogue.put(Message("assistant", reply_text))
+                await asyncio.sleep(0)
+                if turn in (10, 100, 500):
+                    tokens = sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in request)
+                    print(f"预算 {max_tokens or '不限'}: 第{turn}轮 请求 {len(request)} 条消息 / {tokens} tokens, 构造耗时 {build_us:.0f}us")
+
+    asyncio.run(main())
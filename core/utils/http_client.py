@@ -0,0 +1,163 @@
+import json
+import asyncio
+import weakref
+import threading
+import importlib.util
+from collections import Counter
+from urllib.parse import urlsplit
+import httpx
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+# 默认的连接池配置，可在配置文件的 http_client 中修改
+_config = {
+    "max_connections": 100,  # 所有主机合计的最大连接数
+    "max_keepalive_connections": 20,  # 空闲时保留的长连接数
+    "keepalive_expiry": 60,  # 空闲长连接保留时间(秒)
+    "connect_timeout": 10,
+    "read_timeout": 60,
+    "http2": "auto",  # auto 表示安装了 h2 时启用
+}
+_client = None
+# 异步客户端只能在创建它的事件循环中使用，按事件循环保存
+_async_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+class HTTPPoolMetrics:
+    """连接池统计：请求数、新建的TCP连接和TLS握手次数、按主机的请求数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.http2_requests = 0
+        self.hosts = Counter()
+
+    def on_request(self, request, is_async=False):
+        with self._lock:
+            self.requests += 1
+            self.hosts[request.url.host] += 1
+            requests = self.requests
+        # 通过httpcore的trace回调统计实际新建的连接，复用的长连接不会触发
+        request.extensions["trace"] = self._trace_async if is_async else self._trace
+        # 每500次请求输出一次统计
+        if requests % 500 == 0:
+            log_stats()
+
+    def on_response(self, response):
+        with self._lock:
+            if response.http_version == "HTTP/2":
+                self.http2_requests += 1
+            if response.status_code >= 500:
+                self.errors += 1
+
+    def _trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+        elif event_name == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+
+    async def _trace_async(self, event_name, info):
+        self._trace(event_name, info)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "tls_handshakes": self.tls_handshakes,
+                "reuse_rate": 1 - self.new_connections / self.requests if self.requests else 0.0,
+                "http2_requests": self.http2_requests,
+                "server_errors": self.errors,
+                "hosts": dict(self.hosts),
+            }
+
+
+metrics = HTTPPoolMetrics()
+
+
+def configure(config):
+    """按配置文件的 http_client 设置连接池参数，需在创建各供应商实例之前调用"""
+    with _lock:
+        _config.update(config or {})
+
+
+def _client_kwargs():
+    http2 = _config["http2"]
+    if http2 == "auto":
+        http2 = importlib.util.find_spec("h2") is not None
+    return {
+        "limits": httpx.Limits(
+            max_connections=_config["max_connections"],
+            max_keepalive_connections=_config["max_keepalive_connections"],
+            keepalive_expiry=_config["keepalive_expiry"],
+        ),
+        "timeout": httpx.Timeout(_config["read_timeout"], connect=_config["connect_timeout"]),
+        "http2": bool(http2),
+    }
+
+
+def get_client():
+    """取共享的同步HTTP客户端，可在多个线程中同时使用"""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = httpx.Client(
+                event_hooks={
+                    "request": [metrics.on_request],
+                    "response": [metrics.on_response],
+                },
+                **_client_kwargs()
+            )
+        return _client
+
+
+def get_async_client():
+    """取当前事件循环共享的异步HTTP客户端，连接池和keep-alive连接在所有供应商的请求之间复用"""
+    loop = asyncio.get_running_loop()
+
+    async def on_request(request):
+        metrics.on_request(request, is_async=True)
+
+    async def on_response(response):
+        metrics.on_response(response)
+
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = _async_clients[loop] = httpx.AsyncClient(
+                event_hooks={"request": [on_request], "response": [on_response]},
+                **_client_kwargs()
+            )
+        return client
+
+
+def pool_stats():
+    """连接池统计信息，包括当前各连接池中的连接数"""
+    stats = metrics.stats()
+    pools = {}
+    with _lock:
+        clients = [("sync", _client)] + [(f"async-{index}", client) for index, client in enumerate(_async_clients.values())]
+    for name, client in clients:
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        if pool is None:
+            continue
+        connections = pool.connections
+        pools[name] = {
+            "connections": len(connections),
+            "idle": sum(1 for connection in connections if connection.is_idle()),
+            "origins": sorted({urlsplit(str(connection._origin)).hostname or "" for connection in connections}),
+        }
+    stats["pools"] = pools
+    return stats
+
+
+def log_stats():
+    logger.bind(tag=TAG).info(f"HTTP连接池统计: {json.dumps(pool_stats(), ensure_ascii=False)}")
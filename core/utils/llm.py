@@ -3,8 +3,7 @@ import sys
 from config.logger import setup_logging
 import importlib
 from datetime import datetime
-from core.utils.util import is_segment
-from core.utils.util import get_string_no_punctuation_or_emoji
+from core.utils.segmenter import SentenceSegmenter
 from core.utils.util import read_config, get_project_dir
 
 logger = setup_logging()
@@ -40,20 +39,12 @@ if __name__ == "__main__":
     dialogue.append({"role": "system", "content": config.get("prompt")})
     dialogue.append({"role": "user", "content": "你好小智"})
     llm_responses = llm.response("test", dialogue)
-    response_message = []
-    first_text = None
-    start = 0
+    segmenter = SentenceSegmenter.from_config(config.get("segmenter", {}))
 
     for content in llm_responses:
-        response_message.append(content)
-
-        if is_segment(response_message):
-            segment_text = "".join(response_message[start:])
-            segment_text = get_string_no_punctuation_or_emoji(segment_text)
-            if len(segment_text) > 0:
-                if first_text is None:
-                    first_text = segment_text
-                    print("大模型首次返回耗时：" + str(datetime.now() - start_time))
-                start = len(response_message)
+        if segmenter.feed(content) and segmenter.segments == 1:
+            print("大模型首句耗时：" + str(datetime.now() - start_time))
+    segmenter.flush()
 
     print("大模型返回总耗时：" + str(datetime.now() - start_time))
+    print(f"分句数（TTS调用次数）：{segmenter.segments}")
@@ -0,0 +1,127 @@
+import os
+import time
+import threading
+import numpy as np
+from config.logger import setup_logging
+from core.utils.audio import OpusStreamEncoder, OpusPacketStream, OPUS_SAMPLE_RATE, OPUS_FRAME_MS
+from core.utils.tts_cache import TTSAudio
+
+TAG = __name__
+logger = setup_logging()
+
+# 数字逐个念出时使用的文本
+DIGIT_TEXTS = {
+    "0": "零", "1": "一", "2": "二", "3": "三", "4": "四",
+    "5": "五", "6": "六", "7": "七", "8": "八", "9": "九",
+}
+AUTH_CODE_PROMPT = "请在后台输入验证码："
+# 片段合成失败后，间隔该时间(秒)才再次合成
+CLIP_RETRY_SECONDS = 60
+
+
+def synthesize(tts, text):
+    """合成一段语音并编码为Opus，失败返回 None"""
+    if tts.supports_stream:
+        stream = OpusPacketStream()
+        tts.to_opus_stream(text, stream)
+        if stream.error is not None or not stream.packets:
+            return None
+        return TTSAudio(stream.packets, stream.duration)
+    tts_file = tts.to_tts(text)
+    if tts_file is None or not os.path.exists(tts_file):
+        return None
+    return TTSAudio(*tts.wav_to_opus_data(tts_file))
+
+
+class PhraseBank:
+    """预先合成的语音片段库
+
+    按TTS的音色配置保存数字和固定提示语的Opus片段，验证码等模板化的播报
+    直接拼接片段，不再调用TTS。片段同时写入TTS缓存，重启后从磁盘缓存恢复。
+    """
+
+    def __init__(self, cache=None, phrases=(), gap_ms=120):
+        self.cache = cache
+        self.phrases = list(phrases)
+        self._clips = {}
+        self._lock = threading.Lock()
+        self._building = {}
+        # 合成失败的片段和可以再次合成的时间
+        self._failed = {}
+        # 片段之间插入的静音包
+        frame_samples = OPUS_SAMPLE_RATE * OPUS_FRAME_MS // 1000
+        frames = max(0, round(gap_ms / OPUS_FRAME_MS))
+        encoder = OpusStreamEncoder()
+        self._gap = TTSAudio(
+            tuple(encoder.encode(np.zeros(frame_samples * frames, dtype=np.int16))),
+            frames * OPUS_FRAME_MS / 1000
+        )
+
+    @classmethod
+    def from_config(cls, config, cache=None):
+        if not config.get("enabled", True):
+            return None
+        return cls(cache, config.get("phrases", [AUTH_CODE_PROMPT]), config.get("gap_ms", 120))
+
+    def clip(self, tts, text):
+        """取一个片段，没有时合成；同一片段同时只合成一次"""
+        key = (tts.cache_identity, text)
+        with self._lock:
+            audio = self._clips.get(key)
+            if audio is not None:
+                return audio
+            if time.monotonic() < self._failed.get(key, 0):
+                return None
+            building = self._building.get(key)
+            if building is None:
+                building = self._building[key] = threading.Lock()
+        with building:
+            audio = self._clips.get(key)
+            if audio is not None:
+                return audio
+            if time.monotonic() < self._failed.get(key, 0):
+                return None
+            cache_key = self.cache.key(tts, text) if self.cache else None
+            audio = self.cache.get(cache_key) if cache_key else None
+            if audio is None:
+                audio = synthesize(tts, text)
+                if audio is None:
+                    logger.bind(tag=TAG).error(f"语音片段合成失败: {text}，{CLIP_RETRY_SECONDS}s 后再试")
+                    with self._lock:
+                        self._failed[key] = time.monotonic() + CLIP_RETRY_SECONDS
+                        self._building.pop(key, None)
+                    return None
+                if cache_key:
+                    self.cache.put(cache_key, audio)
+            with self._lock:
+                self._clips[key] = audio
+                self._failed.pop(key, None)
+                self._building.pop(key, None)
+            return audio
+
+    def preload(self, tts):
+        """为一个TTS音色合成全部数字和固定提示语"""
+        texts = list(DIGIT_TEXTS.values()) + self.phrases
+        ready = sum(self.clip(tts, text) is not None for text in texts)
+        logger.bind(tag=TAG).info(f"语音片段库已就绪: {ready}/{len(texts)}")
+
+    def assemble(self, tts, parts, gap=True):
+        """按顺序拼接多个片段，任一片段不可用时返回 None"""
+        packets = []
+        duration = 0.0
+        for index, text in enumerate(parts):
+            audio = self.clip(tts, text)
+            if audio is None:
+                return None
+            if gap and index > 0:
+                packets.extend(self._gap.packets)
+                duration += self._gap.duration
+            packets.extend(audio.packets)
+            duration += audio.duration
+        return TTSAudio(packets, duration)
+
+    def auth_code(self, tts, code):
+        """拼接验证码播报：提示语加逐个念出的数字"""
+        if not all(digit in DIGIT_TEXTS for digit in code):
+            return None
+        return self.assemble(tts, [AUTH_CODE_PROMPT] + [DIGIT_TEXTS[digit] for digit in code])
@@ -0,0 +1,67 @@
+import time
+import asyncio
+
+
+class AudioPlayout:
+    """连接的音频发送调度器
+
+    按实时速度发送Opus包，只比设备的播放进度提前 lead 秒，不会一次把整句灌进设备缓冲区；
+    记录设备上的播放时钟，打断时在一帧之内停止发送。只能在连接的事件循环中使用。
+    """
+
+    def __init__(self, send, lead=0.3):
+        self.send = send
+        self.lead = lead
+        # 当前这段连续播放在设备上开始的时间，和之后已发送的音频时长
+        self._start = None
+        self._queued = 0.0
+        self._interrupt = asyncio.Event()
+
+    @property
+    def remaining(self):
+        """设备上还没有播放完的音频时长（秒）"""
+        if self._start is None:
+            return 0.0
+        return max(0.0, self._start + self._queued - time.monotonic())
+
+    async def play(self, packets, packet_duration):
+        """按实时速度发送一组Opus包，返回实际发送的包数，被打断时提前返回"""
+        interrupt = self._interrupt
+        sent = 0
+        for packet in packets:
+            if interrupt.is_set():
+                break
+            now = time.monotonic()
+            if self._start is None or now > self._start + self._queued:
+                # 设备上的音频已经播完（开始播放或合成跟不上时），从现在重新计时
+                self._start = now
+                self._queued = 0.0
+            wait = self._start + self._queued - self.lead - now
+            if wait > 0 and await self._wait(interrupt, wait):
+                break
+            await self.send(packet)
+            self._queued += packet_duration
+            sent += 1
+        return sent
+
+    async def drain(self):
+        """等待设备播放完已发送的音频，被打断时返回 False"""
+        interrupt = self._interrupt
+        remaining = self.remaining
+        return remaining <= 0 or not await self._wait(interrupt, remaining)
+
+    def interrupt(self):
+        """停止正在进行的发送，重置播放时钟"""
+        self._interrupt.set()
+        self._interrupt = asyncio.Event()
+        self._start = None
+        self._queued = 0.0
+
+    @staticmethod
+    async def _wait(interrupt, timeout):
+        """等待 timeout 秒，期间被打断返回 True"""
+        try:
+            await asyncio.wait_for(interrupt.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
@@ -0,0 +1,196 @@
+import os
+import json
+import threading
+from collections import deque
+from concurrent.futures import Future
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+
+class ConnectionExecutor:
+    """一个连接在共享运行时中的任务队列，接口与 ThreadPoolExecutor 的 submit/shutdown 相同"""
+
+    def __init__(self, runtime):
+        self.runtime = runtime
+        self._pending = deque()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        if not self.runtime._enqueue(self, (future, fn, args, kwargs)):
+            future.cancel()
+        return future
+
+    def shutdown(self, wait=False, cancel_futures=True):
+        """连接关闭，取消还没开始执行的任务；共享的工作线程不会退出。重复调用时直接返回"""
+        self.runtime._drop(self)
+
+
+class Runtime:
+    """进程内共享的运行时
+
+    所有连接共用固定数量的CPU工作线程（Opus编码、语音片段拼接等），网络请求在事件循环中进行。
+    各连接的任务分别排队，工作线程按连接轮流取任务，一个连接提交大量任务时不会让其他连接等待。
+    线程数不随连接数增长。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, cpu_workers=0):
+        self.cpu_workers = cpu_workers or os.cpu_count() or 4
+        self._condition = threading.Condition()
+        # 有待执行任务的连接，按轮转顺序排列
+        self._ready = deque()
+        self.connections = 0
+        self.running = 0
+        self.completed = 0
+        self._threads = []
+        for index in range(self.cpu_workers):
+            thread = threading.Thread(target=self._worker, name=f"cpu-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.bind(tag=TAG).info(f"共享运行时已启动，CPU工作线程数: {self.cpu_workers}")
+
+    @classmethod
+    def configure(cls, config):
+        """按配置文件的 runtime 创建共享运行时，需在接受连接之前调用"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(config.get("cpu_workers", 0))
+            return cls._instance
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            return cls.configure({})
+        return cls._instance
+
+    def create_executor(self):
+        with self._condition:
+            self.connections += 1
+        return ConnectionExecutor(self)
+
+    def _enqueue(self, executor, item):
+        """任务放入连接的队列，连接已关闭时返回 False；与 _drop 在同一个锁内检查，关闭后不会再有任务入队"""
+        with self._condition:
+            if executor._shutdown:
+                return False
+            if not executor._pending:
+                self._ready.append(executor)
+            executor._pending.append(item)
+            self._condition.notify()
+            return True
+
+    def _drop(self, executor):
+        with self._condition:
+            if executor._shutdown:
+                return
+            executor._shutdown = True
+            pending = list(executor._pending)
+            executor._pending.clear()
+            try:
+                self._ready.remove(executor)
+            except ValueError:
+                pass
+            self.connections -= 1
+        for future, _, _, _ in pending:
+            future.cancel()
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not self._ready:
+                    self._condition.wait()
+                executor = self._ready.popleft()
+                future, fn, args, kwargs = executor._pending.popleft()
+                # 这个连接还有任务时排到队尾，轮到其他连接之后再执行
+                if executor._pending:
+                    self._ready.append(executor)
+                self.running += 1
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self._condition:
+                    self.running -= 1
+                    self.completed += 1
+
+    def stats(self):
+        with self._condition:
+            return {
+                "cpu_workers": self.cpu_workers,
+                "connections": self.connections,
+                "running": self.running,
+                "queued": sum(len(executor._pending) for executor in self._ready),
+                "completed": self.completed,
+            }
+
+    def log_stats(self):
+        logger.bind(tag=TAG).info(f"运行时统计: {json.dumps(self.stats(), ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    """
+      连接数压力测试：模拟设备连接，统计不同连接数下的线程数和内存
+    """
+    import asyncio
+    import time
+    import numpy as np
+    from core.utils.audio import pcm_to_opus
+    from core.utils.playout import AudioPlayout
+
+    def rss_mb():
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        return 0.0
+
+    runtime = Runtime.get_instance()
+    # 每句话约1.2秒的音频，在CPU工作线程中编码
+    tone = (3000 * np.sin(np.arange(16000 * 6 // 5) / 16000 * 2 * np.pi * 440)).astype(np.int16)
+
+    async def device(stop):
+        """模拟一个设备连接：合成一句、按实时速度发送，循环往复"""
+        executor = runtime.create_executor()
+        sent = 0
+
+        async def send(packet):
+            nonlocal sent
+            sent += 1
+
+        playout = AudioPlayout(send)
+        try:
+            while not stop.is_set():
+                packets, duration = await asyncio.wrap_future(executor.submit(pcm_to_opus, tone))
+                await playout.play(packets, duration / len(packets))
+                await playout.drain()
+        finally:
+            executor.shutdown()
+        return sent
+
+    async def soak(count, seconds):
+        stop = asyncio.Event()
+        tasks = [asyncio.create_task(device(stop)) for _ in range(count)]
+        await asyncio.sleep(seconds)
+        threads, rss = threading.active_count(), rss_mb()
+        stop.set()
+        sent = sum(await asyncio.gather(*tasks))
+        return threads, rss, sent
+
+    async def main():
+        print(f"启动时: 线程数 {threading.active_count()}, 内存 {rss_mb():.1f}MB")
+        for count in (100, 500, 1000):
+            start = time.time()
+            threads, rss, sent = await soak(count, 5)
+            print(f"{count}个连接: 线程数 {threads}, 内存 {rss:.1f}MB, "
+                  f"发送 {sent} 包 / 实时应发 {count * 5 / 0.06:.0f} 包, 耗时 {time.time() - start:.1f}s")
+        runtime.log_stats()
+
+    asyncio.run(main())
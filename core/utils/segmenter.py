@@ -0,0 +1,137 @@
+import re
+import time
+from core.utils.util import get_string_no_punctuation_or_emoji
+
+# 句子结束的标点，英文句号单独处理（后面跟空白才算句末，避免切开小数和缩写）
+SENTENCE_ENDS = frozenset("。！？!?；;…\n")
+# 分句的标点
+CLAUSE_ENDS = frozenset("，,、：:")
+# 需要逐个处理的字符，其余字符整段跳过
+_SPECIAL = re.compile(r"[。！？!?；;…\n，,、：:.\s]")
+
+
+class SentenceSegmenter:
+    """LLM流式输出的增量分句器
+
+    每段文本只扫描一次标点和空白，按句末标点切分；第一句在第一个分句标点处就切出，尽早开始合成；
+    过短的句子与下一句合并，减少TTS调用；超过最大长度时在最近的分句标点或空格处切分，
+    都没有时才按长度切分。
+    """
+
+    def __init__(self, first_min_chars=4, min_chars=6, clause_min_chars=12, max_chars=40):
+        # 第一句的最小长度，达到后遇到分句标点即切出
+        self.first_min_chars = first_min_chars
+        # 句子的最小长度，更短的句子与下一句合并
+        self.min_chars = min_chars
+        # 后续句子在分句标点处切分的最小长度
+        self.clause_min_chars = clause_min_chars
+        self.max_chars = max_chars
+        # 还没有切出的文本块和总长度
+        self._parts = []
+        self._length = 0
+        # 本次 feed 中已经切出的长度，用于换算位置
+        self._cut = 0
+        # 当前缓冲中最近一个可切分位置（分句标点或被合并的短句之后）和最近一个空格之后的位置，0 表示没有
+        self._clause_at = 0
+        self._space_at = 0
+        self._pending_dot = False
+        self.start_time = time.time()
+        self.first_segment_time = None
+        self.segments = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            first_min_chars=config.get("first_min_chars", 4),
+            min_chars=config.get("min_chars", 6),
+            clause_min_chars=config.get("clause_min_chars", 12),
+            max_chars=config.get("max_chars", 40),
+        )
+
+    def feed(self, token):
+        """加入LLM返回的一段文本，返回已经可以合成的句子"""
+        ready = []
+        if not token:
+            return ready
+        offset = self._length
+        self._parts.append(token)
+        self._length += len(token)
+        if self._pending_dot:
+            self._pending_dot = False
+            if token[0].isspace():
+                self._boundary(offset, self._sentence_min(), ready)
+            # 上一段末尾的英文句号到这里才确定是否句末，之后再检查长度
+            self._limit(offset - self._cut, ready)
+        # 最大长度按字符检查：每个字符处理完后缓冲达到 max_chars 即切分，结果与文本如何分段到达无关
+        for match in _SPECIAL.finditer(token):
+            char = match.group()
+            # 标点之前的普通字符
+            self._limit(offset + match.start() - self._cut, ready)
+            # 字符之后的位置，之前的切分会让缓冲整体前移
+            position = offset + match.end() - self._cut
+            if char in SENTENCE_ENDS:
+                self._boundary(position, self._sentence_min(), ready)
+            elif char in CLAUSE_ENDS:
+                self._boundary(position, self.first_min_chars if self.segments == 0 else self.clause_min_chars, ready)
+            elif char == ".":
+                if match.end() < len(token):
+                    if token[match.end()].isspace():
+                        self._boundary(position, self._sentence_min(), ready)
+                else:
+                    self._pending_dot = True
+                    continue
+            else:
+                self._space_at = position
+            self._limit(offset + match.end() - self._cut, ready)
+        self._limit(self._length - self._pending_dot, ready)
+        self._cut = 0
+        return ready
+
+    def flush(self):
+        """LLM输出结束，返回剩余的全部文本"""
+        ready = []
+        self._pending_dot = False
+        if self._length:
+            self._emit(self._length, ready)
+        return ready
+
+    @property
+    def first_segment_ms(self):
+        """从开始到切出第一句的耗时（毫秒），还没有切出时为 None"""
+        if self.first_segment_time is None:
+            return None
+        return (self.first_segment_time - self.start_time) * 1000
+
+    def _sentence_min(self):
+        return self.first_min_chars if self.segments == 0 else self.min_chars
+
+    def _limit(self, length, ready):
+        """缓冲中前 length 个字符达到最大长度时，在最近的分句标点或空格处切分，都没有时按长度切分"""
+        while length >= self.max_chars:
+            position = max(self._clause_at, self._space_at) or self.max_chars
+            self._emit(position, ready)
+            length -= position
+
+    def _boundary(self, position, min_chars, ready):
+        if position >= min_chars:
+            self._emit(position, ready)
+        else:
+            # 太短，先留着与后面的内容合并，但记下这个可切分的位置
+            self._clause_at = position
+
+    def _emit(self, position, ready):
+        buffer = "".join(self._parts)
+        text = buffer[:position]
+        rest = buffer[position:]
+        self._parts = [rest] if rest else []
+        self._length = len(rest)
+        self._cut += position
+        self._clause_at = 0
+        self._space_at = max(0, self._space_at - position)
+        text = get_string_no_punctuation_or_emoji(text)
+        if not text:
+            return
+        if self.first_segment_time is None:
+            self.first_segment_time = time.time()
+        self.segments += 1
+        ready.append(text)
@@ -0,0 +1,191 @@
+import json
+import asyncio
+from websockets.exceptions import ConnectionClosed
+from collections import deque
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+
+class SendQueue:
+    """连接的发送队列
+
+    所有下发给设备的消息都经过这里，由一个发送任务按放入的顺序写入 websocket，
+    sentence_start、stt 等状态消息与音频保持先后顺序；只有 urgent 的消息（stop 等打断类消息）插到排队的音频之前发送。
+    排队的音频超过高水位时判定设备跟不上，之后的音频包直接丢弃，降到低水位以下再恢复，
+    内存占用不会随网络变差而增长；一次发送阻塞超过 stall_timeout 秒时关闭连接。
+    只能在连接的事件循环中使用。
+    """
+
+    def __init__(self, websocket, high_watermark=16 * 1024, low_watermark=4 * 1024, stall_timeout=30, close_timeout=1):
+        self.websocket = websocket
+        self.high_watermark = high_watermark
+        self.low_watermark = min(low_watermark, high_watermark)
+        self.stall_timeout = stall_timeout
+        # 关闭连接前等待已排队消息发出的最长时间(秒)
+        self.close_timeout = close_timeout
+        self._urgent = deque()
+        self._frames = deque()
+        self.audio_frames = 0
+        self._ready = asyncio.Event()
+        # 排队和发送中的音频都发出后置位
+        self._audio_idle = asyncio.Event()
+        self._audio_idle.set()
+        self._closed = False
+        self.audio_bytes = 0
+        self.lagging = False
+        # 统计
+        self.peak_audio_bytes = 0
+        self.sent_frames = 0
+        self.dropped_audio = 0
+        self.cleared_audio = 0
+        self.lag_events = 0
+        self.stalls = 0
+
+    @classmethod
+    def from_config(cls, websocket, config):
+        return cls(
+            websocket,
+            config.get("high_watermark_kb", 16) * 1024,
+            config.get("low_watermark_kb", 4) * 1024,
+            config.get("stall_timeout", 30),
+            config.get("close_timeout", 1),
+        )
+
+    async def send(self, frame, urgent=False):
+        """放入发送队列后立即返回，用法与 websocket.send 相同；urgent 的消息插到排队的音频之前"""
+        self.put(frame, urgent)
+
+    def put(self, frame, urgent=False):
+        if self._closed:
+            return
+        if urgent:
+            self._urgent.append(frame)
+        elif isinstance(frame, str):
+            self._frames.append(frame)
+        else:
+            if self.lagging:
+                self.dropped_audio += 1
+                return
+            self._frames.append(frame)
+            self.audio_frames += 1
+            self._audio_idle.clear()
+            self.audio_bytes += len(frame)
+            self.peak_audio_bytes = max(self.peak_audio_bytes, self.audio_bytes)
+            if self.audio_bytes >= self.high_watermark:
+                self.lagging = True
+                self.lag_events += 1
+                logger.bind(tag=TAG).warning(f"设备接收过慢，排队音频 {self.audio_bytes} 字节，暂停发送新的音频")
+        self._ready.set()
+
+    def clear_audio(self):
+        """丢弃还没有发送的音频（打断时），排队的文本消息保留，返回丢弃的包数"""
+        dropped = self.audio_frames
+        self.cleared_audio += dropped
+        if dropped:
+            self._frames = deque(frame for frame in self._frames if isinstance(frame, str))
+        self.audio_frames = 0
+        self.audio_bytes = 0
+        self.lagging = False
+        return dropped
+
+    async def wait_audio_sent(self):
+        """等待排队的音频全部写入 websocket"""
+        await self._audio_idle.wait()
+
+    async def run(self):
+        """发送任务，连接关闭后退出"""
+        try:
+            while True:
+                if self._urgent:
+                    frame = self._urgent.popleft()
+                elif self._frames:
+                    frame = self._frames.popleft()
+                    if not isinstance(frame, str):
+                        self.audio_frames -= 1
+                        self.audio_bytes -= len(frame)
+                elif self._closed:
+                    return
+                else:
+                    self._audio_idle.set()
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                try:
+                    await asyncio.wait_for(self.websocket.send(frame), self.stall_timeout)
+                except asyncio.TimeoutError:
+                    self.stalls += 1
+                    logger.bind(tag=TAG).warning(f"发送阻塞超过 {self.stall_timeout}s，关闭连接: {json.dumps(self.stats())}")
+                    await self.websocket.close()
+                    return
+                self.sent_frames += 1
+                if not self.audio_frames:
+                    self._audio_idle.set()
+                if self.lagging and self.audio_bytes <= self.low_watermark:
+                    self.lagging = False
+                    logger.bind(tag=TAG).info(f"设备接收恢复，累计丢弃音频 {self.dropped_audio} 包")
+        except ConnectionClosed:
+            pass
+        finally:
+            self._closed = True
+            self.clear_audio()
+            self._audio_idle.set()
+
+    def close(self):
+        """不再接收新消息，已排队的消息发送完后发送任务退出"""
+        self._closed = True
+        self._ready.set()
+
+    def stats(self):
+        return {
+            "urgent_depth": len(self._urgent),
+            "queue_depth": len(self._frames),
+            "audio_depth": self.audio_frames,
+            "audio_bytes": self.audio_bytes,
+            "peak_audio_bytes": self.peak_audio_bytes,
+            "sent_frames": self.sent_frames,
+            "dropped_audio": self.dropped_audio,
+            "cleared_audio": self.cleared_audio,
+            "lag_events": self.lag_events,
+            "stalls": self.stalls,
+        }
+
+
+if __name__ == "__main__":
+    """
+      慢速设备测试：设备每秒只能接收一半的实时音频，统计排队内存、丢包和打断消息的延迟
+    """
+    import time
+
+    class SlowSocket:
+        def __init__(self, rate):
+            self.rate = rate  # 每秒能接收的字节数
+            self.control_delays = []
+
+        async def send(self, frame):
+            if isinstance(frame, str):
+                self.control_delays.append(time.monotonic() - json.loads(frame)["time"])
+                return
+            await asyncio.sleep(len(frame) / self.rate)
+
+        async def close(self):
+            pass
+
+    async def main():
+        socket = SlowSocket(rate=1000)
+        queue = SendQueue(socket)
+        sender = asyncio.create_task(queue.run())
+        packet = b"\0" * 120
+        # 20秒的音频按实时速度（每60ms一包）放入队列，每秒插入一条打断类消息
+        for index in range(int(20 / 0.06)):
+            await queue.send(packet)
+            if index % 16 == 0:
+                await queue.send(json.dumps({"type": "tts", "state": "stop", "time": time.monotonic()}), urgent=True)
+            await asyncio.sleep(0.06)
+        print(f"队列统计: {json.dumps(queue.stats())}")
+        print(f"打断消息最大延迟: {max(socket.control_delays) * 1000:.0f}ms")
+        queue.close()
+        await sender
+
+    asyncio.run(main())
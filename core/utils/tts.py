@@ -5,6 +5,7 @@ import importlib
 from datetime import datetime
 from core.utils.util import read_config, get_project_dir
 
+TAG = __name__
 logger = setup_logging()
 
 
@@ -14,7 +15,11 @@ def create_instance(class_name, *args, **kwargs):
         lib_name = f'core.providers.tts.{class_name}'
         if lib_name not in sys.modules:
             sys.modules[lib_name] = importlib.import_module(f'{lib_name}')
-        return sys.modules[lib_name].TTSProvider(*args, **kwargs)
+        instance = sys.modules[lib_name].TTSProvider(*args, **kwargs)
+        # 按供应商声明的能力选择服务端处理开销最低的音频格式
+        output_format = instance.negotiate_output_format()
+        logger.bind(tag=TAG).info(f"TTS {class_name} 输出格式: {output_format}")
+        return instance
 
     raise ValueError(f"不支持的TTS类型: {class_name}，请检查该配置的type是否设置正确")
 
@@ -39,3 +44,13 @@ if __name__ == "__main__":
     start = datetime.now()
     tts.wav_to_opus_data(file_path)
     print("语音opus耗时：" + str(datetime.now() - start))
+    if tts.supports_stream:
+        from core.utils.audio import OpusPacketStream
+        import threading
+        stream = OpusPacketStream()
+        start = datetime.now()
+        threading.Thread(target=tts.to_opus_stream, args=("你好，测试,我是人工智能小智", stream)).start()
+        for index, packets in enumerate(stream.chunks()):
+            if index == 0:
+                print("流式合成首包耗时：" + str(datetime.now() - start))
+        print("流式合成总耗时：" + str(datetime.now() - start))
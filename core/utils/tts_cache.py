@@ -0,0 +1,285 @@
+import os
+import json
+import asyncio
+import struct
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict, namedtuple
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+# 一段已经编码好的语音：Opus包列表和时长（秒）
+TTSAudio = namedtuple("TTSAudio", ["packets", "duration"])
+
+# 磁盘缓存文件格式：魔数、时长、包数、每个包的长度，之后是所有包的数据
+_MAGIC = b"XZT1"
+_HEADER = struct.Struct("<4sdI")
+
+
+def normalize_text(text):
+    """统一全半角并合并空白，标点保留（会影响语气）"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class TTSCache:
+    """TTS语音缓存，按供应商、音色配置和文本查找已编码的Opus音频
+
+    内存中按LRU保留最近使用的语音，同时写入有容量上限的磁盘目录，
+    重启后磁盘中的语音仍可命中。命中时跳过语音合成和Opus编码。
+    多进程模式下每个工作进程只写入和清理自己的子目录，容量上限按进程数平分，
+    其他进程的子目录只读，一个进程合成的语音其他进程也能命中。
+    """
+
+    def __init__(self, memory_max_bytes=64 * 1024 * 1024, disk_dir=None,
+                 disk_max_bytes=512 * 1024 * 1024, max_text_length=0, shared_dirs=()):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        # 其他工作进程的磁盘缓存目录，只读
+        self.shared_dirs = list(shared_dirs)
+        # 只缓存不超过该长度的句子，0 表示不限制
+        self.max_text_length = max_text_length
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        # 正在写入磁盘的键，同一句只写一次
+        self._writing = set()
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    @classmethod
+    def from_config(cls, config, worker=None, workers=1):
+        """worker 为多进程模式下的工作进程序号，workers 为工作进程数"""
+        if not config.get("enabled", True):
+            return None
+        disk_dir = config.get("disk_dir")
+        disk_max_bytes = int(config.get("disk_max_mb", 512) * 1024 * 1024)
+        shared_dirs = []
+        if disk_dir and worker is not None:
+            shared_dirs = [os.path.join(disk_dir, f"worker-{index}") for index in range(workers) if index != worker]
+            disk_dir = os.path.join(disk_dir, f"worker-{worker}")
+            disk_max_bytes //= workers
+        return cls(
+            memory_max_bytes=int(config.get("memory_max_mb", 64) * 1024 * 1024),
+            disk_dir=disk_dir,
+            disk_max_bytes=disk_max_bytes,
+            max_text_length=config.get("max_text_length", 0),
+            shared_dirs=shared_dirs,
+        )
+
+    def key(self, tts, text):
+        """缓存键：供应商模块、音色等配置和规范化后文本的sha256"""
+        if self.max_text_length and len(text) > self.max_text_length:
+            return None
+        payload = f"{tts.cache_identity}\n{normalize_text(text)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load_disk_index(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".opus"):
+                continue
+            stat = os.stat(os.path.join(self.disk_dir, name))
+            entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        # 按最后使用时间排序，最久未用的在前面
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._trim_disk()
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.opus")
+
+    @staticmethod
+    def _audio_bytes(audio):
+        return sum(len(packet) for packet in audio.packets)
+
+    async def get_async(self, key, executor):
+        """在事件循环中查找缓存：内存命中直接返回，需要读磁盘时在 executor 中执行"""
+        if key is None:
+            return None
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return audio
+        if not self.disk_dir and not self.shared_dirs:
+            return self.get(key)
+        return await asyncio.wrap_future(executor.submit(self.get, key))
+
+    def get(self, key):
+        """查找缓存，未命中返回 None；会读取磁盘，不要在事件循环中直接调用"""
+        if key is None:
+            return None
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return audio
+            on_disk = key in self._disk
+        audio = self._read_disk(key) if on_disk else self._read_shared(key)
+        with self._lock:
+            if audio is None:
+                self.misses += 1
+                lookups = self.hits_memory + self.hits_disk + self.misses
+            else:
+                self.hits_disk += 1
+                if on_disk:
+                    self._disk.move_to_end(key)
+                self._put_memory(key, audio)
+        if audio is None:
+            # 每100次未命中输出一次统计
+            if lookups % 100 == 0:
+                self.log_stats()
+            return None
+        if not on_disk:
+            return audio
+        try:
+            # 更新修改时间，重启后按最后使用时间恢复LRU顺序
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            pass
+        return audio
+
+    def put(self, key, audio, executor=None):
+        """写入缓存；executor 不为空时磁盘写入提交到其中执行，调用方不等待"""
+        if key is None or not audio.packets:
+            return
+        audio = TTSAudio(tuple(audio.packets), audio.duration)
+        with self._lock:
+            self._put_memory(key, audio)
+            if not self.disk_dir or key in self._disk or key in self._writing:
+                return
+            # 先占住这个键，同时未命中的其他连接不会重复写入和重复计算大小
+            self._writing.add(key)
+        if executor is None:
+            self._put_disk(key, audio)
+            return
+        future = executor.submit(self._put_disk, key, audio)
+        # 连接关闭时还没执行的写入被取消，释放占用的键
+        future.add_done_callback(lambda f: f.cancelled() and self._release_writing(key))
+
+    def _put_disk(self, key, audio):
+        try:
+            size = self._write_disk(key, audio)
+        except OSError as e:
+            # 磁盘满、没有权限等情况下只保存在内存中，不影响这一句的播放
+            logger.bind(tag=TAG).warning(f"TTS磁盘缓存写入失败，只保存在内存: {key}: {e}")
+            self._release_writing(key)
+            return
+        with self._lock:
+            self._writing.discard(key)
+            if key not in self._disk:
+                self._disk[key] = size
+                self._disk_bytes += size
+            self._trim_disk()
+
+    def _release_writing(self, key):
+        with self._lock:
+            self._writing.discard(key)
+
+    def _put_memory(self, key, audio):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = audio
+        self._memory_bytes += self._audio_bytes(audio)
+        while self._memory_bytes > self.memory_max_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= self._audio_bytes(evicted)
+            self.evictions += 1
+
+    def _trim_disk(self):
+        while self._disk_bytes > self.disk_max_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _write_disk(self, key, audio):
+        lengths = struct.pack(f"<{len(audio.packets)}H", *(len(packet) for packet in audio.packets))
+        data = _HEADER.pack(_MAGIC, audio.duration, len(audio.packets)) + lengths + b"".join(audio.packets)
+        # 先写临时文件再改名，其他线程不会读到写了一半的文件
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return len(data)
+
+    @staticmethod
+    def _read_file(path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, duration, count = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("bad magic")
+        offset = _HEADER.size
+        lengths = struct.unpack_from(f"<{count}H", data, offset)
+        offset += 2 * count
+        packets = []
+        for length in lengths:
+            packets.append(data[offset:offset + length])
+            offset += length
+        return TTSAudio(tuple(packets), duration)
+
+    def _read_shared(self, key):
+        """在其他工作进程的目录中查找，文件可能随时被所属进程清理，读取失败按未命中处理"""
+        for directory in self.shared_dirs:
+            path = os.path.join(directory, f"{key}.opus")
+            if not os.path.exists(path):
+                continue
+            try:
+                return self._read_file(path)
+            except (OSError, ValueError, struct.error):
+                continue
+        return None
+
+    def _read_disk(self, key):
+        try:
+            return self._read_file(self._path(key))
+        except (OSError, ValueError, struct.error) as e:
+            logger.bind(tag=TAG).warning(f"TTS磁盘缓存读取失败: {key}: {e}")
+            with self._lock:
+                size = self._disk.pop(key, 0)
+                self._disk_bytes -= size
+            return None
+
+    def stats(self):
+        """命中率等统计信息"""
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def log_stats(self):
+        logger.bind(tag=TAG).info(f"TTS缓存统计: {json.dumps(self.stats(), ensure_ascii=False)}")
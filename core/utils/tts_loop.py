@@ -0,0 +1,58 @@
+import asyncio
+import threading
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+
+class TTSEventLoop:
+    """TTS专用的常驻事件循环
+
+    所有原生异步的TTS请求都作为协程在这一个循环中并发执行，
+    不再为每句话、每次重试用 asyncio.run 新建和销毁事件循环。
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="tts-loop", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        logger.bind(tag=TAG).info("TTS事件循环已启动")
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """把协程提交到TTS事件循环，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """在调用线程中等待协程在TTS事件循环中执行完成"""
+        return self.submit(coro).result(timeout)
+
+
+_thread_local = threading.local()
+
+
+def run_in_thread_loop(coro):
+    """旧式TTS供应商和同步调用方的适配，在调用线程复用的事件循环中执行协程
+
+    协程内部有阻塞调用的实现不能放到共享循环中，改为在调用线程自己的事件循环中执行，
+    同一线程的循环会被复用，不再每次新建。
+    """
+    loop = getattr(_thread_local, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = _thread_local.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(coro)
@@ -0,0 +1,139 @@
+import asyncio
+from collections import deque
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+
+class _Segment:
+    __slots__ = ("turn", "text", "fn", "args", "result", "task")
+
+    def __init__(self, turn, text, fn, args):
+        self.turn = turn
+        self.text = text
+        self.fn = fn
+        self.args = args
+        self.result = asyncio.get_running_loop().create_future()
+        self.task = None
+
+
+class TTSPipeline:
+    """按顺序播放、有限预取的语音合成流水线
+
+    句子按提交顺序排队，同时合成中或合成完等待播放的句子不超过 prefetch 句，
+    播放端取走一句后才开始合成下一句，既不会让播放断档，也不会一次把整段回复都发给TTS。
+    每次合成有超时，失败或超时后重试；超时后仍在线程中执行的合成结束后才重试，
+    再等一个超时时间仍未结束时放弃这一句。只能在连接的事件循环中使用。
+    """
+
+    def __init__(self, executor, prefetch=2, timeout=10, retries=1):
+        self.executor = executor
+        self.prefetch = max(1, prefetch)
+        self.timeout = timeout
+        self.retries = retries
+        self._waiting = deque()  # 还没开始合成的句子
+        self._started = deque()  # 已开始合成、等待播放的句子
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    @classmethod
+    def from_config(cls, executor, config, tts=None):
+        # TTS配置中的 prefetch 优先，不同供应商的并发限制和合成速度不同
+        prefetch = getattr(tts, "prefetch", None) or config.get("prefetch", 2)
+        return cls(executor, prefetch, config.get("timeout", 10), config.get("retries", 1))
+
+    def put(self, turn, text, fn, *args):
+        """提交一句，fn(*args) 返回 (音频, 文本)；fn 是协程函数时在事件循环中执行，否则在线程池中执行"""
+        self._waiting.append(_Segment(turn, text, fn, args))
+        self._schedule()
+        self._ready.set()
+
+    def _schedule(self):
+        while self._waiting and len(self._started) < self.prefetch:
+            segment = self._waiting.popleft()
+            if segment.turn.cancelled:
+                continue
+            segment.task = segment.turn.add_task(asyncio.create_task(self._synthesize(segment)), "tts_segments")
+            self._started.append(segment)
+
+    async def _synthesize(self, segment):
+        result = (None, segment.text)
+        try:
+            for attempt in range(self.retries + 1):
+                if asyncio.iscoroutinefunction(segment.fn):
+                    # 协程直接在事件循环中执行
+                    running = asyncio.ensure_future(segment.turn.run_async(segment.fn, *segment.args))
+                    cancel = running.cancel
+                else:
+                    future = segment.turn.submit(self.executor, segment.fn, *segment.args)
+                    running = asyncio.wrap_future(future)
+                    cancel = future.cancel
+                try:
+                    await asyncio.wait([running], timeout=self.timeout)
+                except asyncio.CancelledError:
+                    cancel()
+                    raise
+                if not running.done():
+                    logger.bind(tag=TAG).error(f"TTS 任务超时: {segment.text}，第{attempt + 1}次")
+                    cancel()
+                    # 已在线程中开始的合成无法中断，等它结束后再重试，期间这一句仍占用预取名额；
+                    # 最多再等一个超时时间，仍未结束时放弃这一句，释放名额，线程留在后台
+                    done, _ = await asyncio.wait([running], timeout=self.timeout)
+                    if not done:
+                        logger.bind(tag=TAG).error(f"TTS 任务取消后 {self.timeout}s 仍未结束，放弃这一句: {segment.text}")
+                        break
+                    continue
+                if running.cancelled():
+                    break
+                try:
+                    result = running.result()
+                except Exception as e:
+                    logger.bind(tag=TAG).error(f"TTS 任务出错: {segment.text}，第{attempt + 1}次: {e}")
+                    continue
+                if result[0] is not None or segment.turn.cancelled:
+                    break
+        finally:
+            if not segment.result.done():
+                segment.result.set_result(result)
+
+    async def get(self):
+        """按提交顺序取下一句的合成结果，返回 (音频, 文本)；所属轮次已打断的句子返回 (None, 文本)，
+        流水线关闭后返回 (None, None)"""
+        while not self._started:
+            if self._closed:
+                return None, None
+            self._ready.clear()
+            self._schedule()
+            if not self._started:
+                await self._ready.wait()
+        segment = self._started[0]
+        try:
+            # 合成任务被取消时也会给出结果，这里被取消时句子留给下一次 get
+            result = await asyncio.shield(segment.result)
+            # 等待期间流水线已关闭，剩余的句子不是合成失败
+            return (None, None) if self._closed else result
+        finally:
+            if segment.result.done() and self._started and self._started[0] is segment:
+                self._started.popleft()
+                # 取走一句，空出的预取名额给下一句
+                self._schedule()
+
+    def clear(self):
+        """丢弃还没有播放的句子，返回丢弃的句子数"""
+        dropped = len(self._waiting) + len(self._started)
+        for segment in self._started:
+            if segment.task is not None:
+                segment.task.cancel()
+            if not segment.result.done():
+                segment.result.set_result((None, segment.text))
+        self._waiting.clear()
+        self._started.clear()
+        return dropped
+
+    def close(self):
+        """连接关闭，丢弃剩余的句子并唤醒等待中的 get"""
+        self._closed = True
+        dropped = self.clear()
+        self._ready.set()
+        return dropped
@@ -0,0 +1,142 @@
+import json
+import time
+import threading
+import contextvars
+from collections import Counter
+from concurrent.futures import Future
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+# 当前任务所属的对话轮次，线程池任务和事件循环中的协程都通过它找到所属轮次
+_current = contextvars.ContextVar("turn_scope", default=None)
+
+
+class AbortMetrics:
+    """打断统计：打断次数、关闭的LLM流、取消的TTS任务和丢弃的待播放语音"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = Counter()
+        self.total_ms = 0.0
+
+    def record(self, freed, elapsed_ms):
+        with self._lock:
+            self.counts["aborts"] += 1
+            self.counts.update(freed)
+            self.total_ms += elapsed_ms
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+            stats["avg_cancel_ms"] = self.total_ms / self.counts["aborts"] if self.counts["aborts"] else 0.0
+            return stats
+
+
+metrics = AbortMetrics()
+
+
+class TurnScope:
+    """一轮对话的取消范围
+
+    登记这一轮产生的LLM任务、TTS线程池任务、TTS事件循环中的请求和流式合成的包队列，
+    打断时一起取消：未开始的TTS任务不再执行，进行中的HTTP请求和LLM流立即关闭。
+    """
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._tasks = []
+        self._futures = []
+        self._streams = []
+
+    @staticmethod
+    def current():
+        """当前正在执行的任务所属的对话轮次，不在任何轮次中时返回 None"""
+        return _current.get()
+
+    def add_task(self, task, kind="llm_streams"):
+        """登记连接事件循环中的 asyncio 任务（LLM流式响应、TTS流水线中的句子），kind 为统计时的分类"""
+        with self._lock:
+            if not self.cancelled:
+                self._tasks.append((task, kind))
+                return task
+        self.loop.call_soon_threadsafe(task.cancel)
+        return task
+
+    def track(self, future: Future):
+        """登记线程池或TTS事件循环返回的 future"""
+        with self._lock:
+            if not self.cancelled:
+                self._futures.append(future)
+                return future
+        future.cancel()
+        return future
+
+    def add_stream(self, stream):
+        with self._lock:
+            if not self.cancelled:
+                self._streams.append(stream)
+                return stream
+        stream.cancel()
+        return stream
+
+    def submit(self, executor, fn, *args):
+        """把这一轮的任务提交到线程池，任务执行期间 current() 返回本轮次"""
+        return self.track(executor.submit(self._run, fn, *args))
+
+    def _run(self, fn, *args):
+        token = _current.set(self)
+        try:
+            return fn(*args)
+        finally:
+            _current.reset(token)
+
+    async def run_async(self, fn, *args):
+        """在事件循环中执行这一轮的协程任务，执行期间 current() 返回本轮次"""
+        token = _current.set(self)
+        try:
+            return await fn(*args)
+        finally:
+            _current.reset(token)
+
+    def cancel(self, pending=None):
+        """取消这一轮的全部任务，pending 为待播放的队列（有 clear 方法），返回释放的资源数量"""
+        start = time.perf_counter()
+        with self._lock:
+            if self.cancelled:
+                return Counter()
+            self.cancelled = True
+            tasks, self._tasks = self._tasks, []
+            futures, self._futures = self._futures, []
+            streams, self._streams = self._streams, []
+        freed = Counter()
+        for task, kind in tasks:
+            if not task.done():
+                self.loop.call_soon_threadsafe(task.cancel)
+                freed[kind] += 1
+        for future in futures:
+            if future.done():
+                continue
+            # 未开始的任务 cancel 成功，正在执行的线程池任务会在其中的TTS请求被取消后结束
+            if future.cancel():
+                freed["tts_cancelled"] += 1
+            else:
+                freed["tts_running"] += 1
+        for stream in streams:
+            if not stream.cancelled:
+                stream.cancel()
+                freed["tts_streams"] += 1
+        if pending is not None:
+            dropped = pending.clear()
+            if dropped:
+                freed["queued_dropped"] += dropped
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        metrics.record(freed, elapsed_ms)
+        logger.bind(tag=TAG).info(
+            f"对话已打断，释放: {json.dumps(dict(freed), ensure_ascii=False)}，耗时 {elapsed_ms:.2f}ms，"
+            f"累计: {json.dumps(metrics.stats(), ensure_ascii=False)}"
+        )
+        return freed
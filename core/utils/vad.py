@@ -1,6 +1,10 @@
 from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from config.logger import setup_logging
 import opuslib_next
+import asyncio
+import threading
 import time
 import numpy as np
 import torch
@@ -8,12 +12,98 @@ import torch
 TAG = __name__
 logger = setup_logging()
 
+# Silero VAD 在16kHz下每次推理固定512个采样点，并携带64个采样点的上下文
+VAD_WINDOW_SAMPLES = 512
+VAD_CONTEXT_SAMPLES = 64
+VAD_SAMPLE_RATE = 16000
+
+
 class VAD(ABC):
+    @abstractmethod
+    def decode(self, conn, opus_packet):
+        """把Opus包解码为16kHz单声道PCM，解码结果供VAD和ASR共用"""
+        pass
+
     @abstractmethod
     def is_vad(self, conn, data):
         """检测音频数据中的语音活动"""
         pass
 
+    async def is_vad_async(self, conn, data):
+        """异步检测语音活动，默认直接调用同步实现"""
+        return self.is_vad(conn, data)
+
+    def acquire_session(self):
+        """为新连接分配独立的检测会话，默认实现无会话状态"""
+        return None
+
+    def release_session(self, session):
+        """连接关闭时归还检测会话"""
+        pass
+
+
+class VADSessionPoolExhausted(Exception):
+    """VAD会话池已满"""
+    pass
+
+
+class SileroStreamState:
+    """单条音频流的Silero循环状态，推理时换入共享模型"""
+
+    def __init__(self):
+        self.state = torch.zeros((2, 1, 128))
+        self.context = torch.zeros((1, VAD_CONTEXT_SAMPLES))
+
+    def reset(self):
+        self.state = torch.zeros((2, 1, 128))
+        self.context = torch.zeros((1, VAD_CONTEXT_SAMPLES))
+
+
+class VADSession:
+    """单个连接独占的VAD会话，持有自己的Opus解码器和Silero循环状态"""
+
+    def __init__(self):
+        self.decoder = opuslib_next.Decoder(16000, 1)
+        self.stream = SileroStreamState()
+
+    def reset(self):
+        self.decoder.reset_state()
+        # 换一个新的状态对象：VAD工作线程中还在推理的batch只会写回旧对象，不会把上一个连接的状态带给下一个连接
+        self.stream = SileroStreamState()
+
+
+class VADSessionPool:
+    """有上限的VAD会话池，连接关闭后会话重置并回收复用"""
+
+    def __init__(self, max_sessions):
+        self.max_sessions = max_sessions
+        self._idle = deque()
+        self._in_use = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> VADSession:
+        with self._lock:
+            if self._in_use >= self.max_sessions:
+                raise VADSessionPoolExhausted(f"VAD会话数已达上限: {self.max_sessions}")
+            self._in_use += 1
+            if self._idle:
+                return self._idle.pop()
+        return VADSession()
+
+    def release(self, session: VADSession):
+        session.reset()
+        with self._lock:
+            self._in_use -= 1
+            self._idle.append(session)
+
+    @property
+    def in_use(self):
+        return self._in_use
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
 
 class SileroVAD(VAD):
     def __init__(self, config):
@@ -24,46 +114,209 @@ class SileroVAD(VAD):
                                                 force_reload=False)
         (get_speech_timestamps, _, _, _, _) = self.utils
 
-        self.decoder = opuslib_next.Decoder(16000, 1)
         self.vad_threshold = config.get("threshold")
         self.silence_threshold_ms = config.get("min_silence_duration_ms")
 
-    def is_vad(self, conn, opus_packet):
+        # 批量推理配置
+        self.batch_enabled = config.get("batch_enabled", True)
+        self.batch_tick_ms = config.get("batch_tick_ms", 10)
+        self.batch_max_size = config.get("batch_max_size", 256)
+        self.engine = None
+
+        # 每个连接独立的解码器和循环状态，从会话池中分配
+        self.session_pool = VADSessionPool(config.get("max_sessions", 1000))
+
+    def acquire_session(self):
+        return self.session_pool.acquire()
+
+    def release_session(self, session):
+        if session is None:
+            return
+        if self.engine is not None:
+            self.engine.discard(session.stream)
+        self.session_pool.release(session)
+
+    def forward(self, streams, chunks):
+        """对多条流各一个窗口做一次前向推理
+
+        streams: 每个窗口所属流的 SileroStreamState（同一批内不能重复）
+        chunks: float32 张量，形状为 [batch, 512]
+        返回每个窗口的语音概率列表
+        """
+        batch_size = len(streams)
+        with torch.no_grad():
+            # 把各条流的循环状态拼成一个batch换入模型，推理后再拆回去
+            self.model._state = torch.cat([s.state for s in streams], dim=1)
+            self.model._context = torch.cat([s.context for s in streams], dim=0)
+            self.model._last_sr = VAD_SAMPLE_RATE
+            self.model._last_batch_size = batch_size
+            probs = self.model(chunks, VAD_SAMPLE_RATE)
+            new_state = self.model._state
+            new_context = self.model._context
+        for i, stream in enumerate(streams):
+            stream.state = new_state[:, i:i + 1]
+            stream.context = new_context[i:i + 1]
+        return probs.view(-1).tolist()
+
+    def decode(self, conn, opus_packet):
         try:
-            pcm_frame = self.decoder.decode(opus_packet, 960)
-            conn.client_audio_buffer += pcm_frame  # 将新数据加入缓冲区
+            return conn.vad_session.decoder.decode(opus_packet, 960)
+        except opuslib_next.OpusError as e:
+            logger.bind(tag=TAG).info(f"解码错误: {e}")
+            return None
+
+    def _take_windows(self, conn, pcm_frame):
+        """把PCM帧加入缓冲区，取出所有完整的512采样窗口"""
+        conn.client_audio_buffer.write(pcm_frame)  # 将新数据加入缓冲区
+
+        windows = []
+        while len(conn.client_audio_buffer) >= VAD_WINDOW_SAMPLES:
+            # 提取前512个采样点，转换为模型需要的格式
+            window = conn.client_audio_buffer.read(VAD_WINDOW_SAMPLES).astype(np.float32)
+            window *= 1.0 / 32768.0
+            windows.append(window)
+        return windows
+
+    def _update_voice_state(self, conn, speech_prob):
+        """根据单个窗口的语音概率更新连接的说话状态"""
+        client_have_voice = speech_prob >= self.vad_threshold
+
+        # 如果之前有声音，但本次没有声音，且与上次有声音的时间查已经超过了静默阈值，则认为已经说完一句话
+        if conn.client_have_voice and not client_have_voice:
+            stop_duration = time.time() * 1000 - conn.client_have_voice_last_time
+            if stop_duration >= self.silence_threshold_ms:
+                conn.client_voice_stop = True
+        if client_have_voice:
+            conn.client_have_voice = True
+            conn.client_have_voice_last_time = time.time() * 1000
+        return client_have_voice
 
-            # 处理缓冲区中的完整帧（每次处理512采样点）
+    def is_vad(self, conn, pcm_frame):
+        try:
+            stream = conn.vad_session.stream
             client_have_voice = False
-            while len(conn.client_audio_buffer) >= 512 * 2:
-                # 提取前512个采样点（1024字节）
-                chunk = conn.client_audio_buffer[:512 * 2]
-                conn.client_audio_buffer = conn.client_audio_buffer[512 * 2:]
-
-                # 转换为模型需要的张量格式
-                audio_int16 = np.frombuffer(chunk, dtype=np.int16)
-                audio_float32 = audio_int16.astype(np.float32) / 32768.0
-                audio_tensor = torch.from_numpy(audio_float32)
-
-                # 检测语音活动
-                speech_prob = self.model(audio_tensor, 16000).item()
-                client_have_voice = speech_prob >= self.vad_threshold
-
-                # 如果之前有声音，但本次没有声音，且与上次有声音的时间查已经超过了静默阈值，则认为已经说完一句话
-                if conn.client_have_voice and not client_have_voice:
-                    stop_duration = time.time() * 1000 - conn.client_have_voice_last_time
-                    if stop_duration >= self.silence_threshold_ms:
-                        conn.client_voice_stop = True
-                if client_have_voice:
-                    conn.client_have_voice = True
-                    conn.client_have_voice_last_time = time.time() * 1000
+            # 逐个窗口推理（每次处理512采样点）
+            for window in self._take_windows(conn, pcm_frame):
+                audio_tensor = torch.from_numpy(window).unsqueeze(0)
+                speech_prob = self.forward([stream], audio_tensor)[0]
+                client_have_voice = self._update_voice_state(conn, speech_prob)
 
             return client_have_voice
-        except opuslib_next.OpusError as e:
-            logger.bind(tag=TAG).info(f"解码错误: {e}")
         except Exception as e:
             logger.bind(tag=TAG).error(f"Error processing audio packet: {e}")
 
+    async def is_vad_async(self, conn, pcm_frame):
+        """在事件循环上只做分窗和状态更新，模型推理交给VAD工作线程"""
+        try:
+            windows = self._take_windows(conn, pcm_frame)
+            if not windows:
+                return False
+            if self.engine is None:
+                if self.batch_enabled:
+                    self.engine = BatchVADEngine(self, self.batch_tick_ms, self.batch_max_size)
+                else:
+                    self.engine = BatchVADEngine(self, 0, 1)
+            speech_probs = await self.engine.submit(conn.vad_session.stream, windows)
+
+            client_have_voice = False
+            for speech_prob in speech_probs:
+                client_have_voice = self._update_voice_state(conn, speech_prob)
+            return client_have_voice
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"Error processing audio packet: {e}")
+
+
+class BatchVADEngine:
+    """多连接批量VAD推理引擎
+
+    各连接提交待检测的512采样窗口，引擎每个tick把所有流的队首窗口拼成一个batch，
+    携带每条流各自的循环状态做一次前向推理，再把概率分发回对应连接。
+    同一条流的多个窗口按顺序分到连续的batch中，保证循环状态的时序正确。
+
+    前向推理在独立的VAD工作线程中执行，不阻塞事件循环；推理期间新到达的窗口
+    会累积到下一个batch。连接处理完一个音频包的检测结果后才提交下一个包，
+    每条流排队的窗口不会超过一个包的窗口数。
+    """
+
+    def __init__(self, vad: SileroVAD, tick_ms=10, max_batch=256):
+        self.vad = vad
+        self.tick = tick_ms / 1000.0
+        self.max_batch = max_batch
+        self._queues = OrderedDict()  # stream -> deque[(window, future)]
+        self._wakeup = asyncio.Event()
+        # 共享模型推理时会换入各流的状态，只能由单个工作线程串行执行
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vad-worker")
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+        # 统计信息
+        self.total_windows = 0
+        self.total_batches = 0
+
+    async def submit(self, stream, windows):
+        """提交一条流的若干窗口，等待并返回按顺序的语音概率"""
+        loop = asyncio.get_running_loop()
+        queue = self._queues.setdefault(stream, deque())
+        futures = []
+        for window in windows:
+            future = loop.create_future()
+            queue.append((window, future))
+            futures.append(future)
+        self._wakeup.set()
+        return await asyncio.gather(*futures)
+
+    def discard(self, stream):
+        """丢弃一条流尚未推理的窗口（连接关闭、会话回收时调用）"""
+        queue = self._queues.pop(stream, None)
+        if queue:
+            for _, future in queue:
+                future.cancel()
+
+    def _next_batch(self):
+        """从每条有待处理窗口的流中各取一个窗口"""
+        streams, windows, futures = [], [], []
+        for stream in list(self._queues):
+            if len(streams) >= self.max_batch:
+                break
+            queue = self._queues[stream]
+            window, future = queue.popleft()
+            if not queue:
+                del self._queues[stream]
+            else:
+                # 本轮已取过的流移到队尾，下一轮公平地从其他流开始
+                self._queues.move_to_end(stream)
+            streams.append(stream)
+            windows.append(window)
+            futures.append(future)
+        return streams, windows, futures
+
+    async def _infer(self, streams, windows, futures):
+        try:
+            chunks = torch.from_numpy(np.stack(windows))
+            speech_probs = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.vad.forward, streams, chunks
+            )
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"批量VAD推理失败: {e}")
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, speech_prob in zip(futures, speech_probs):
+            if not future.done():
+                future.set_result(speech_prob)
+        self.total_windows += len(streams)
+        self.total_batches += 1
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            if self.tick > 0:
+                # 等待一个tick，尽量收集更多连接的窗口
+                await asyncio.sleep(self.tick)
+            self._wakeup.clear()
+            while self._queues:
+                await self._infer(*self._next_batch())
+
 
 def create_instance(class_name, *args, **kwargs) -> VAD:
     # 获取类对象
@@ -75,3 +328,33 @@ def create_instance(class_name, *args, **kwargs) -> VAD:
     if cls := cls_map.get(class_name):
         return cls(*args, **kwargs)
     raise ValueError(f"不支持的SileroVAD类型: {class_name}")
+
+
+if __name__ == "__main__":
+    """
+      吞吐测试：逐窗口推理 vs 多连接批量推理
+    """
+    from core.utils.util import read_config, get_project_dir
+
+    config = read_config(get_project_dir() + "config.yaml")
+    vad = create_instance(config["selected_module"]["VAD"], config["VAD"][config["selected_module"]["VAD"]])
+    rounds = 50
+    # 预热，避免首次推理的JIT优化耗时影响结果
+    for _ in range(10):
+        vad.forward([SileroStreamState()], torch.zeros(1, VAD_WINDOW_SAMPLES))
+    for num_streams in (1, 16, 64, 256):
+        streams = [SileroStreamState() for _ in range(num_streams)]
+        chunks = torch.rand(num_streams, VAD_WINDOW_SAMPLES) * 0.2 - 0.1
+
+        start = time.time()
+        for _ in range(rounds):
+            for i, stream in enumerate(streams):
+                vad.forward([stream], chunks[i:i + 1])
+        serial = num_streams * rounds / (time.time() - start)
+
+        start = time.time()
+        for _ in range(rounds):
+            vad.forward(streams, chunks)
+        batched = num_streams * rounds / (time.time() - start)
+
+        print(f"连接数 {num_streams:4d}: 逐窗口 {serial:9.0f} 窗口/秒, 批量 {batched:9.0f} 窗口/秒, 加速 {batched / serial:.1f}x")
@@ -4,45 +4,70 @@ from config.logger import setup_logging
 from core.connection import ConnectionHandler
 from core.utils.util import get_local_ip
 from core.utils import asr, vad, llm, tts
+from core.utils.tts_cache import TTSCache
+from core.utils.phrase_bank import PhraseBank
+from core.utils import http_client
+from core.utils.runtime import Runtime
+import threading
 
 TAG = __name__
 
+
+def create_processing_instances(config):
+    """创建处理模块实例"""
+    return (
+        vad.create_instance(
+            config["selected_module"]["VAD"],
+            config["VAD"][config["selected_module"]["VAD"]]
+        ),
+        asr.create_instance(
+            config["selected_module"]["ASR"],
+            config["ASR"][config["selected_module"]["ASR"]],
+            config["delete_audio"]
+        ),
+        llm.create_instance(
+            config["selected_module"]["LLM"]
+            if not 'type' in config["LLM"][config["selected_module"]["LLM"]]
+            else
+            config["LLM"][config["selected_module"]["LLM"]]['type'],
+            config["LLM"][config["selected_module"]["LLM"]],
+        ),
+        tts.create_instance(
+            config["selected_module"]["TTS"]
+            if not 'type' in config["TTS"][config["selected_module"]["TTS"]]
+            else
+            config["TTS"][config["selected_module"]["TTS"]]["type"],
+            config["TTS"][config["selected_module"]["TTS"]],
+            config["delete_audio"]
+        )
+    )
+
+
 class WebSocketServer:
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, instances=None, worker=None):
+        """worker 为多进程模式下的工作进程序号，单进程时为 None"""
         self.config = config
         self.logger = setup_logging()
-        self._vad, self._asr, self._llm, self._tts = self._create_processing_instances()
-
-    def _create_processing_instances(self):
-        """创建处理模块实例"""
-        return (
-            vad.create_instance(
-                self.config["selected_module"]["VAD"],
-                self.config["VAD"][self.config["selected_module"]["VAD"]]
-            ),
-            asr.create_instance(
-                self.config["selected_module"]["ASR"],
-                self.config["ASR"][self.config["selected_module"]["ASR"]],
-                self.config["delete_audio"]
-            ),
-            llm.create_instance(
-                self.config["selected_module"]["LLM"]
-                if not 'type' in self.config["LLM"][self.config["selected_module"]["LLM"]]
-                else
-                self.config["LLM"][self.config["selected_module"]["LLM"]]['type'],
-                self.config["LLM"][self.config["selected_module"]["LLM"]],
-            ),
-            tts.create_instance(
-                self.config["selected_module"]["TTS"]
-                if not 'type' in self.config["TTS"][self.config["selected_module"]["TTS"]]
-                else
-                self.config["TTS"][self.config["selected_module"]["TTS"]]["type"],
-                self.config["TTS"][self.config["selected_module"]["TTS"]],
-                self.config["delete_audio"]
-            )
+        # 连接池参数需在创建供应商实例之前设置
+        http_client.configure(self.config.get("http_client", {}))
+        # 所有连接共用的CPU工作线程，线程数不随连接数增长
+        Runtime.configure(self.config.get("runtime", {}))
+        # 多进程模式下由主进程加载一次，各工作进程共享
+        self._vad, self._asr, self._llm, self._tts = instances or create_processing_instances(self.config)
+        # 所有连接共用一个TTS缓存，私有配置的TTS实例按各自的音色配置区分
+        self._tts_cache = TTSCache.from_config(
+            self.config.get("tts_cache", {}), worker, self.config["server"].get("workers", 1)
         )
+        phrase_bank_config = self.config.get("phrase_bank", {})
+        self._phrase_bank = PhraseBank.from_config(phrase_bank_config, self._tts_cache)
+        # 片段只用于私有配置的验证码播报，未启用私有配置时不预加载；
+        # 多进程模式下只由第一个工作进程合成，其他进程从磁盘缓存读取
+        if (self._phrase_bank and self.config.get("use_private_config", False)
+                and phrase_bank_config.get("preload", True) and worker in (None, 0)):
+            # 在后台为默认TTS合成语音片段，不影响服务启动
+            threading.Thread(target=self._phrase_bank.preload, args=(self._tts,), daemon=True).start()
 
-    async def start(self):
+    async def start(self, reuse_port=False):
         server_config = self.config["server"]
         host = server_config["ip"]
         port = server_config["port"]
@@ -52,11 +77,14 @@ class WebSocketServer:
         async with websockets.serve(
                 self._handle_connection,
                 host,
-                port
+                port,
+                reuse_port=reuse_port
         ):
             await asyncio.Future()
 
     async def _handle_connection(self, websocket):
         """处理新连接，每次创建独立的ConnectionHandler"""
-        handler = ConnectionHandler(self.config, self._vad, self._asr, self._llm, self._tts)
+        handler = ConnectionHandler(
+            self.config, self._vad, self._asr, self._llm, self._tts, self._tts_cache, self._phrase_bank
+        )
         await handler.handle_connection(websocket)
@@ -0,0 +1,32 @@
+import pytest
+from core.utils.segmenter import SentenceSegmenter
+
+TEXTS = [
+    "你好，我是小智。今天天气不错，适合出去走走！你想去哪里呢？" * 20,
+    "这是一段没有任何标点符号的很长很长的文本" * 30,
+    "Hello there. The price is 3.5 dollars, right? Yes. This sentence has many words and no punctuation at all for a while " * 10,
+    "第一句很短。好。然后是一句特别特别长而且只有逗号分隔的句子，里面有很多内容，一直说下去，直到超过最大长度为止。" * 15,
+]
+
+
+def segment(text, chunk_size, **kwargs):
+    segmenter = SentenceSegmenter(**kwargs)
+    segments = []
+    for start in range(0, len(text), chunk_size):
+        segments.extend(segmenter.feed(text[start:start + chunk_size]))
+    segments.extend(segmenter.flush())
+    return segments
+
+
+@pytest.mark.parametrize("text", TEXTS, ids=["zh", "no-punctuation", "en", "clauses"])
+@pytest.mark.parametrize("chunk_size", [2, 3, 7, 16, 50, 1000, 100000])
+def test_segments_do_not_depend_on_chunk_size(text, chunk_size):
+    assert segment(text, chunk_size) == segment(text, 1)
+
+
+@pytest.mark.parametrize("text", TEXTS, ids=["zh", "no-punctuation", "en", "clauses"])
+@pytest.mark.parametrize("chunk_size", [1, 1000])
+def test_segments_respect_max_chars(text, chunk_size):
+    max_chars = 40
+    segments = segment(text, chunk_size, max_chars=max_chars)
+    assert all(len(segment_text) <= max_chars for segment_text in segments)